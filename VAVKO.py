@@ -1,12 +1,28 @@
 ИЗМЕНЕНИЕ
 import sys
 import os
+import re
 import sqlite3
+import csv
+import queue
+import threading
+import time
+import logging
 import tempfile
+import hashlib
+import json
+import zipfile
 import shutil
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain, repeat
+from logging.handlers import RotatingFileHandler
 from datetime import datetime
-from io import BytesIO
+from io import BytesIO, StringIO
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
@@ -14,7 +30,7 @@ from PyQt6.QtGui import *
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
 from PyQt6.QtGui import QIcon 
 
-from PIL import Image
+from PIL import Image, ImageOps
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.utils import ImageReader
@@ -29,6 +45,110 @@ TEXT_COLUMN_WIDTH = 100
 ZOOM_MIN = 10
 ZOOM_MAX = 300
 ZOOM_DEFAULT = 100
+SQL_BATCH_SIZE = 500  # Параметров в одном IN (...), с запасом под лимит SQLite
+COPY_CHUNK_ROWS = 2000  # Строк за один fetchmany при копировании
+CLIPBOARD_MAX_CELLS = 500000  # Больше - предлагаем сохранить в файл
+TABLE_CHUNK_ROWS = 5000  # Строк за шаг при пересборке и заполнении таблиц
+
+READ_POOL_SIZE = 4  # Соединений только для чтения для фоновых задач
+QUERY_PROGRESS_STEPS = 100000  # Инструкций SQLite между вызовами обработчика прогресса
+QUERY_PROGRESS_DELAY_MS = 700  # Индикатор запроса появляется, только если запрос долгий
+JOIN_ROWS_WARN = 200000  # Оценка результата соединения, выше которой спрашиваем пользователя
+JOIN_SAMPLE_ROWS = 10000  # Строк в выборке для оценки COUNT(DISTINCT), если нет sqlite_stat1
+
+RESULT_CACHE_ENTRIES = 8  # Последних результатов запросов в кэше
+RESULT_CACHE_BYTES = 268435456  # 256 МБ данных на все результаты в кэше
+
+BACKUP_PAGES_PER_STEP = 1024  # Страниц за шаг Connection.backup; между шагами база свободна
+INCREMENTAL_VACUUM_PAGES = 1000  # Страниц за одну транзакцию incremental_vacuum
+
+# Фото нормализуются при добавлении: поворот по EXIF, ограничение стороны, перекодирование
+PHOTO_INGEST = {
+    "max_edge": 2048,     # Длинная сторона, пикселей
+    "format": "JPEG",     # JPEG или WEBP
+    "quality": 85,
+    "thumbnail": False,   # Хранить миниатюру в колонке <фото>_thumb
+}
+PHOTO_THUMB_EDGE = 240
+PHOTO_THUMB_SUFFIX = "_thumb"
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+PHOTO_KEY_PATTERN = r"(?P<key>.+)"  # Ключ записи из имени файла (без расширения)
+PHOTO_WRITE_BATCH = 200  # Строк в одном executemany при массовой записи фото
+PHOTO_STORE_TABLE = "vavko_photos"  # Общее хранилище повторяющихся фото по SHA-256
+PHOTO_REF_PREFIX = "photo:sha256:"  # Значение ячейки, ссылающееся на PHOTO_STORE_TABLE
+PHOTO_FILE_PREFIX = "photo:file:"  # Значение ячейки, ссылающееся на файл во внешнем хранилище
+PHOTO_FILES_SUFFIX = ".photos"  # Папка внешнего хранилища рядом с файлом базы
+PHOTO_KEYWORDS = ['photo', 'image', 'img', 'picture', 'pic', 'фото']
+TRANSCODE_PROGRESS_TABLE = "vavko_transcode_progress"  # Точка продолжения пережатия колонки
+PHOTO_EXTRACT_CHUNK = 200  # Строк с BLOB за один fetchmany при выгрузке
+PHOTO_EXTRACT_THREADS = 4
+PHASH_TABLE = "vavko_photo_hashes"  # Перцептивные хеши фото для поиска похожих
+PHASH_THRESHOLD = 6  # Отличающихся бит из 64, при которых фото считаются похожими
+PHASH_BLOCK = 256  # Строк хешей в одном векторном сравнении внутри корзины
+GALLERY_ICON_EDGE = 128
+GALLERY_CACHE_PIXMAPS = 1000  # Декодированных миниатюр в памяти галереи (LRU)
+GALLERY_PREFETCH_PAGES = 1  # Экранов, подгружаемых заранее выше и ниже видимого
+GALLERY_THREADS = 2
+
+SNAPSHOT_TABLE = "vavko_join_snapshot"  # TEMP-таблица с материализованным соединением
+
+SLOW_QUERY_MS = 200  # Запросы дольше этого пишутся в журнал медленных запросов
+SLOW_LOG_FILE = "vavko_slow_queries.log"
+SLOW_LOG_BYTES = 1048576  # Размер файла журнала до ротации
+SLOW_LOG_BACKUPS = 3
+
+# Профили подключения: PRAGMA применяются при подключении и на время тяжёлых операций.
+# busy_timeout во всех профилях - параллельные записи ждут, а не падают с "database is locked".
+DEFAULT_PROFILE = "interactive"
+CONNECTION_PROFILES = {
+    "interactive": {
+        "title": "Интерактивный",
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -65536,        # 64 МБ
+            "mmap_size": 268435456,      # 256 МБ
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+    },
+    "bulk_import": {
+        "title": "Массовый импорт",
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "cache_size": -262144,       # 256 МБ
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+            "busy_timeout": 30000,
+        },
+    },
+    "reporting": {
+        "title": "Отчёты (только чтение)",
+        "pragmas": {
+            "query_only": "ON",
+            "cache_size": -131072,       # 128 МБ
+            "mmap_size": 1073741824,     # 1 ГБ
+            "temp_store": "MEMORY",
+            "busy_timeout": 10000,
+        },
+    },
+    "network_share": {
+        # WAL и mmap не работают надёжно на сетевых дисках
+        "title": "Сетевой диск",
+        "pragmas": {
+            "journal_mode": "DELETE",
+            "synchronous": "FULL",
+            "cache_size": -32768,        # 32 МБ
+            "mmap_size": 0,
+            "temp_store": "MEMORY",
+            "busy_timeout": 30000,
+        },
+    },
+}
+
+# Что tunedFor меняет на время тяжёлой операции; journal_mode и mmap остаются от профиля подключения
+TUNED_PRAGMAS = ("synchronous", "cache_size", "temp_store")
 
 # Единая стилизация: строгий, читаемый интерфейс
 APP_STYLESHEET = """
@@ -104,6 +224,141 @@ def applyTextFit(widget):
         if hasattr(chk, "setWordWrap"):
             chk.setWordWrap(True)
 
+def encodeImage(img, fmt, quality):
+    if fmt == "JPEG" and img.mode != "RGB":
+        # В JPEG нет прозрачности - кладём на белый фон
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, "white")
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    elif fmt == "WEBP" and img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    options = {"quality": quality, "optimize": True} if fmt == "JPEG" else {"quality": quality, "method": 4}
+    out = BytesIO()
+    img.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def normalizeImage(data, settings=PHOTO_INGEST):
+    """Поворачивает по EXIF, ограничивает длинную сторону и перекодирует.
+
+    Анимацию и уже подходящие файлы, которые после перекодирования
+    только вырастут, возвращает как есть."""
+    img = Image.open(BytesIO(data))
+    if getattr(img, "n_frames", 1) > 1:
+        return data
+    rotated = img.getexif().get(0x0112, 1) != 1  # EXIF Orientation
+    img = ImageOps.exif_transpose(img)
+    edge = settings["max_edge"]
+    resized = max(img.size) > edge
+    if resized:
+        img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+    encoded = encodeImage(img, settings["format"], settings["quality"])
+    if not resized and not rotated and len(encoded) >= len(data):
+        return data
+    return encoded
+
+
+def makeThumbnail(data, edge=PHOTO_THUMB_EDGE):
+    img = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+    return encodeImage(img, "JPEG", 80)
+
+
+def imageFormat(data):
+    """Расширение файла по сигнатуре изображения, None если это не картинка"""
+    if data[:3] == b'\xff\xd8\xff':
+        return "jpg"
+    if data[:4] == b'\x89PNG':
+        return "png"
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return "gif"
+    if data[:2] == b'BM':
+        return "bmp"
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return "webp"
+    return None
+
+
+def transcodeBlob(data, settings):
+    """Пережимает BLOB-картинку в процессе пула; None, если не картинка или выигрыша нет"""
+    if not isinstance(data, bytes) or imageFormat(data) is None:
+        return None
+    try:
+        out = normalizeImage(data, settings)
+    except Exception:
+        return None
+    return out if out is not data and len(out) < len(data) else None
+
+
+def ingestFile(path, settings):
+    """Читает и нормализует файл фото; выполняется в процессе пула.
+
+    Возвращает (путь, фото, миниатюра, ошибка)."""
+    try:
+        with open(path, 'rb') as f:
+            data = normalizeImage(f.read(), settings)
+        thumb = makeThumbnail(data) if settings["thumbnail"] else None
+        return path, data, thumb, None
+    except Exception as e:
+        return path, None, None, str(e)
+
+
+def photoDigest(data):
+    """SHA-256 содержимого ячейки; в SQL - проверка, что фото не сменилось после чтения"""
+    return hashlib.sha256(data).hexdigest() if isinstance(data, bytes) else None
+
+
+def photoHash(data):
+    """64-битный dHash: сравнение яркости соседних пикселей уменьшенной до 9x8 картинки.
+
+    Выполняется в процессе пула. Возвращает знаковое целое (как INTEGER SQLite)
+    или None, если это не картинка."""
+    if not isinstance(data, bytes) or imageFormat(data) is None:
+        return None
+    try:
+        img = Image.open(BytesIO(data))
+        img.draft("L", (64, 64))  # JPEG сразу декодируется уменьшенным
+        img = ImageOps.exif_transpose(img).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    except Exception:
+        return None
+    px = np.asarray(img, dtype=np.int16)
+    return int(np.packbits(px[:, 1:] > px[:, :-1]).view(">i8")[0])
+
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hammingDistance(a, b):
+    """Расстояния Хэмминга между массивами 64-битных хешей (с broadcast)"""
+    x = np.bitwise_xor(a, b)
+    return POPCOUNT_TABLE[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def similarPhotoPairs(hashes, threshold):
+    """Пары индексов хешей, отличающихся не более чем на threshold бит: {(i, j): расстояние}.
+
+    Хеш делится на threshold + 1 полос: у таких пар хотя бы одна полоса
+    совпадает целиком, поэтому сравниваются только хеши из общей корзины."""
+    hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+    edges = np.linspace(0, 64, min(threshold, 63) + 2).astype(int)
+    pairs = {}
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        keys = (hashes >> np.uint64(lo)) & np.uint64((1 << int(hi - lo)) - 1)
+        order = np.argsort(keys, kind="stable")
+        for bucket in np.split(order, np.flatnonzero(np.diff(keys[order])) + 1):
+            if len(bucket) < 2:
+                continue
+            sub = hashes[bucket]
+            for start in range(0, len(bucket), PHASH_BLOCK):
+                dist = hammingDistance(sub[start:start + PHASH_BLOCK, None], sub[None, :])
+                i, j = np.nonzero(dist <= threshold)
+                keep = j > i + start
+                i, j = i[keep], j[keep]
+                for a, b, d in zip(bucket[i + start], bucket[j], dist[i, j]):
+                    pairs[(int(a), int(b))] = int(d)
+    return pairs
+
+
 class ImageWidget(QWidget):
     """Виджет для отображения миниатюры изображения"""
     clicked = pyqtSignal(int, int)
@@ -185,6 +440,374 @@ class ImageWidget(QWidget):
         self.setStyleSheet("background-color: #ffffff; border: 1px solid #cbd5e0; border-radius: 4px;")
 
 
+class PhotoStore:
+    """Внешнее хранилище фото: файлы по SHA-256 в папке <база>.photos/ab/cd/.
+
+    Включено, если папка существует. Файлы читаются напрямую, минуя кэш
+    страниц SQLite; одинаковое содержимое хранится один раз. Папку нужно
+    копировать вместе с базой (copyTo), файлы без ссылок убирает prune."""
+
+    def __init__(self, db_path):
+        path = Path(os.path.abspath(db_path))
+        # По полному имени: у data.db и data.sqlite разные хранилища, prune одной не тронет другую
+        self.root = path.with_name(path.name + PHOTO_FILES_SUFFIX)
+
+    def enabled(self):
+        return self.root.is_dir()
+
+    def path(self, name):
+        return self.root / name[:2] / name[2:4] / name
+
+    def put(self, data):
+        """Записывает фото (если такого ещё нет) и возвращает ссылку для ячейки"""
+        name = f"{hashlib.sha256(data).hexdigest()}.{imageFormat(data) or 'bin'}"
+        path = self.path(name)
+        if path.exists():
+            # Свежая дата защищает уже лежащий файл от prune, идущего параллельно
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Через временный файл: прерванная запись не оставит битое фото под верным именем
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return PHOTO_FILE_PREFIX + name
+
+    def read(self, ref):
+        if not isinstance(ref, str) or not ref.startswith(PHOTO_FILE_PREFIX):
+            return None
+        try:
+            return self.path(ref[len(PHOTO_FILE_PREFIX):]).read_bytes()
+        except OSError:
+            return None
+
+    def copyTo(self, db_path):
+        """Копирует хранилище к копии базы; уже лежащие там файлы (то же содержимое) пропускаются"""
+        target = PhotoStore(db_path).root
+        copied = 0
+        for src in self.root.rglob("*"):
+            if not src.is_file() or src.suffix == ".tmp":
+                continue
+            dest = target / src.relative_to(self.root)
+            if not dest.exists():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(src, dest)
+                copied += 1
+        return copied
+
+    def prune(self, referenced, before):
+        """Удаляет файлы, на которые не ссылается ни одна ячейка.
+
+        Файлы, изменённые после before (начала поиска ссылок), не трогает:
+        на них могли сослаться уже после него. Возвращает (файлов, байт)."""
+        removed = size = 0
+        for path in self.root.rglob("*"):
+            if not path.is_file() or path.name in referenced:
+                continue
+            stat = path.stat()
+            if stat.st_mtime < before:
+                path.unlink()
+                removed += 1
+                size += stat.st_size
+        return removed, size
+
+
+class ResultCache:
+    """LRU-кэш результатов запросов, ограниченный числом записей и объёмом данных.
+
+    Ключ включает версии данных базы, поэтому изменения - свои или чужие -
+    делают старые записи недостижимыми, а не устаревшими."""
+
+    def __init__(self, entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES):
+        self.entries = entries
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+        return item
+
+    def put(self, key, rows, size):
+        if size > self.max_bytes:
+            return
+        if key in self.items:
+            self.size -= self.items.pop(key)[1]
+        self.items[key] = (rows, size)
+        self.size += size
+        while len(self.items) > self.entries or self.size > self.max_bytes:
+            self.size -= self.items.popitem(last=False)[1][1]
+
+    def clear(self):
+        self.items.clear()
+        self.size = 0
+
+
+class QueryTracer:
+    """Счётчики выполненных SQLite инструкций и журнал медленных запросов.
+
+    Значения параметров и литералы в журнал не попадают - только форма запроса."""
+
+    LITERAL = re.compile(r"'(?:[^']|'')*'|\bX'[0-9A-Fa-f]*'|\b\d+(?:\.\d+)?\b")
+
+    def __init__(self, path, threshold_ms=SLOW_QUERY_MS):
+        self.threshold = threshold_ms / 1000
+        self.counts = Counter()
+        self.mark_counts = Counter()
+        self.log = logging.getLogger(f"vavko.slow.{id(self)}")
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.handler = RotatingFileHandler(path, maxBytes=SLOW_LOG_BYTES,
+                                           backupCount=SLOW_LOG_BACKUPS, encoding="utf-8")
+        self.handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.log.addHandler(self.handler)
+
+    def normalize(self, sql):
+        return " ".join(self.LITERAL.sub("?", sql).split())
+
+    def trace(self, sql):
+        """set_trace_callback: вызывается SQLite для каждой выполняемой инструкции"""
+        self.counts[self.normalize(sql)] += 1
+
+    def timed(self, sql, params, elapsed):
+        if elapsed >= self.threshold:
+            n = len(params) if params else 0
+            self.log.info("%.1f мс | %s | параметров: %d (скрыты)", elapsed * 1000, self.normalize(sql), n)
+
+    def mark(self):
+        self.mark_counts = self.counts.copy()
+
+    def sinceMark(self):
+        return self.counts - self.mark_counts
+
+    def close(self):
+        self.log.removeHandler(self.handler)
+        self.handler.close()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий execute/executemany, если у соединения включён трассировщик"""
+
+    def execute(self, sql, params=()):
+        tracer = self.connection.tracer
+        if tracer is None:
+            return super().execute(sql, params)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            tracer.timed(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, seq):
+        tracer = self.connection.tracer
+        if tracer is None:
+            return super().executemany(sql, seq)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            tracer.timed(sql, (), time.perf_counter() - started)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Соединение, чьи курсоры (и execute-сокращения) проходят через TracedCursor"""
+    tracer = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+
+class ReadPool:
+    """Пул соединений только для чтения (mode=ro, query_only) для фоновых задач.
+
+    Запись остаётся на основном соединении; в режиме WAL читатели из пула
+    не блокируют редактирование и не ждут его."""
+
+    def __init__(self, path, size=READ_POOL_SIZE):
+        self.uri = Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def connect(self):
+        pragmas = CONNECTION_PROFILES["reporting"]["pragmas"]
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False,
+                               timeout=pragmas["busy_timeout"] / 1000)
+        for key, val in pragmas.items():
+            conn.execute(f"PRAGMA {key} = {val}")
+        return conn
+
+    def acquire(self, timeout=None):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if not create:
+            return self.idle.get(timeout=timeout)
+        try:
+            return self.connect()
+        except:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def release(self, conn):
+        if self.closed:
+            conn.close()
+            return
+        # Завершаем транзакцию чтения, чтобы не удерживать старый снимок WAL
+        conn.rollback()
+        self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def closeIdle(self):
+        """Закрывает простаивающие соединения; новые откроются по требованию"""
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self.lock:
+                self.created -= 1
+
+    def close(self):
+        self.closed = True
+        self.closeIdle()
+
+
+class PoolTask(QThread):
+    """Выполняет fn(conn, progress) в фоне на соединении из пула чтения"""
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(object, str)  # object: счётчики строк не влезают в 32-битный int
+
+    def __init__(self, pool, fn, parent=None):
+        super().__init__(parent)
+        self.pool = pool
+        self.fn = fn
+
+    def run(self):
+        try:
+            with self.pool.connection() as conn:
+                result = self.fn(conn, self.progress.emit)
+            self.done.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class WriteTask(QThread):
+    """Выполняет fn(conn, progress) в фоне на отдельном пишущем соединении.
+
+    Нужен для долгих DDL вроде CREATE INDEX: основное соединение остаётся
+    свободным, а busy_timeout заставляет ждать чужие записи, а не падать.
+    Надёжность записи берётся из активного профиля: фоновые VACUUM и переносы
+    фото не должны повредить файл при сбое."""
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(int, str)
+
+    SYNC_LEVELS = ["OFF", "NORMAL", "FULL", "EXTRA"]
+
+    def __init__(self, path, fn, profile=DEFAULT_PROFILE, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.fn = fn
+        self.profile = profile
+
+    def pragmas(self):
+        active = CONNECTION_PROFILES[self.profile]["pragmas"]
+        bulk = CONNECTION_PROFILES["bulk_import"]["pragmas"]
+        # synchronous не ниже NORMAL; journal_mode общий для файла и задан основным соединением,
+        # temp_store по умолчанию - большие сортировки CREATE INDEX уходят на диск, а не в память
+        level = max(self.SYNC_LEVELS.index(active.get("synchronous", "NORMAL")), 1)
+        return {"synchronous": self.SYNC_LEVELS[level], "cache_size": bulk["cache_size"],
+                "mmap_size": active.get("mmap_size", 0), "busy_timeout": bulk["busy_timeout"]}
+
+    def run(self):
+        pragmas = self.pragmas()
+        try:
+            conn = sqlite3.connect(self.path, timeout=pragmas["busy_timeout"] / 1000)
+            try:
+                for key, val in pragmas.items():
+                    conn.execute(f"PRAGMA {key} = {val}")
+                result = self.fn(conn, self.progress.emit)
+                conn.commit()
+            finally:
+                conn.close()
+            self.done.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class PhotoGalleryLoader(QThread):
+    """Декодирует миниатюры галереи в фоне на соединениях из пула чтения.
+
+    Очередь заменяется целиком при прокрутке: строки, ушедшие с экрана,
+    не декодируются зря."""
+    loaded = pyqtSignal(int, object)  # object: QImage или None, если не картинка
+
+    def __init__(self, pool, fetch, parent=None):
+        super().__init__(parent)
+        self.pool = pool
+        self.fetch = fetch
+        self.wanted = []
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+
+    def request(self, rows):
+        with self.cond:
+            self.wanted = list(rows)
+            self.cond.notify_all()
+
+    def stop(self):
+        self.stopped.set()
+        with self.cond:
+            self.cond.notify_all()
+        self.wait()
+
+    def run(self):
+        with ThreadPoolExecutor(GALLERY_THREADS) as workers:
+            for _ in range(GALLERY_THREADS):
+                workers.submit(self.work)
+
+    def work(self):
+        while True:
+            with self.cond:
+                while not self.wanted and not self.stopped.is_set():
+                    self.cond.wait()
+                if self.stopped.is_set():
+                    return
+                row, rowid = self.wanted.pop(0)
+            try:
+                with self.pool.connection() as conn:
+                    image = self.fetch(conn, rowid)
+            except Exception:
+                image = None
+            self.loaded.emit(row, image)
+
+
 class ModernDatabaseApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -193,9 +816,25 @@ class ModernDatabaseApp(QMainWindow):
         self.db_name = None
         self.current_table = None
         self.connection = None
+        self.read_pool = None
+        self.tasks = set()
         self.joined_tables = []
         self.selected_attributes = []
         self.table_joins = {}
+        self.view_sort = (None, "ASC")
+        self.index_suggestions = []
+        self.last_query = {}
+        self.view_stats = {}
+        self.tracer = None
+        self.result_cache = ResultCache()
+        self.snapshot = None
+        self.query_running = False
+        self.view_stale = False  # Грид правили на месте: порядок строк мог разойтись с запросом
+        self.row_counts = {}
+        self.estimate_memo = None
+        self.photo_settings = dict(PHOTO_INGEST)
+        self.photo_store = None
+        self.profile = DEFAULT_PROFILE
         self.russian_font_registered = False
         self.initUI()
         self.selectDatabase()
@@ -239,6 +878,11 @@ class ModernDatabaseApp(QMainWindow):
         self.setStatusBar(self.status)
         self.status.showMessage("Готов к работе")
         
+        # Панель разработчика (F12): SQL, план и тайминги текущего вида
+        self.dev_panel = self.createDevPanel()
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.dev_panel)
+        self.dev_panel.hide()
+        
         applyTextFit(self)
         self.setupHotkeys()
 
@@ -250,9 +894,9 @@ class ModernDatabaseApp(QMainWindow):
         
         try:
             query, cols = self.buildQuery()
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            rows = self.runQuery(query)
+            if rows is None:
+                return
             
             if not rows:
                 QMessageBox.information(self, "Информация", "Нет данных")
@@ -531,9 +1175,17 @@ class ModernDatabaseApp(QMainWindow):
         self.db_label.setFont(QFont("Segoe UI", 9))
         self.db_label.setStyleSheet("color: #4a5568;")
         
+        self.profile_combo = QComboBox()
+        for key, profile in CONNECTION_PROFILES.items():
+            self.profile_combo.addItem(profile['title'], key)
+        self.profile_combo.setCurrentIndex(self.profile_combo.findData(self.profile))
+        self.profile_combo.currentIndexChanged.connect(self.changeProfile)
+        
         layout.addWidget(title)
         #layout.addWidget(hotkeys)
         layout.addStretch()
+        layout.addWidget(QLabel("Профиль:"))
+        layout.addWidget(self.profile_combo)
         layout.addWidget(self.db_label)
         
         return widget
@@ -551,6 +1203,8 @@ class ModernDatabaseApp(QMainWindow):
             ("🔍 Исследовать", self.inspectDB, "primary"),
             ("🖨️ Сохранить PDF", self.printData, "warning"),
             ("🖨️ Напечатать", self.printToPrinter, "warning"),  # <--- НОВАЯ КНОПКА
+            ("🖼 Фото", self.showPhotoMenu, "success"),
+            ("🛠 Сервис", self.showServiceMenu, "secondary"),
             ("💾 Сменить БД", self.changeDB, "secondary"),
         ]
         
@@ -562,11 +1216,11 @@ class ModernDatabaseApp(QMainWindow):
             btn.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
             btn.setMinimumHeight(20)
             
-            row = i // 5  # Теперь 5 колонок в ряду
-            col = i % 5
+            row = i // 6  # 6 колонок в ряду
+            col = i % 6
             layout.addWidget(btn, row, col)
         
-        for i in range(5):
+        for i in range(6):
             layout.setColumnStretch(i, 1)
             
         layout.setRowStretch(0, 1)
@@ -658,8 +1312,14 @@ class ModernDatabaseApp(QMainWindow):
         advanced_btn.clicked.connect(self.joinTablesAdvanced)
         advanced_btn.setMinimumHeight(18)
         
-        for btn in (clear_btn, remove_btn, advanced_btn):
-            self.styleButton(btn, "danger" if btn == clear_btn else "secondary" if btn == remove_btn else "primary")
+        self.snapshot_btn = QPushButton("📌 Снимок")
+        self.snapshot_btn.setToolTip("Сохранить соединение во временную таблицу: сортировка без повторного JOIN")
+        self.snapshot_btn.clicked.connect(self.toggleSnapshot)
+        self.snapshot_btn.setMinimumHeight(18)
+        
+        for btn, style in ((clear_btn, "danger"), (remove_btn, "secondary"),
+                           (advanced_btn, "primary"), (self.snapshot_btn, "secondary")):
+            self.styleButton(btn, style)
             btn.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
             btn_layout.addWidget(btn)
             
@@ -725,11 +1385,19 @@ class ModernDatabaseApp(QMainWindow):
         rename_btn = QPushButton("📝 Переименовать")
         rename_btn.clicked.connect(self.renameAttribute)
         
+        bulk_btn = QPushButton("✏️ Массовое изменение")
+        bulk_btn.clicked.connect(self.bulkUpdate)
+        
+        self.index_btn = QPushButton("⚡ Индексы")
+        self.index_btn.clicked.connect(self.manageIndexes)
+        
         buttons_data = [
             (add_btn_, "success"),
             (add_col, "success"),
             (delete_btn, "danger"),
-            (rename_btn, "primary")
+            (rename_btn, "primary"),
+            (bulk_btn, "primary"),
+            (self.index_btn, "secondary")
         ]
         
         for i, (btn, style) in enumerate(buttons_data):
@@ -774,6 +1442,62 @@ class ModernDatabaseApp(QMainWindow):
         
         return widget
     
+    def createDevPanel(self):
+        dock = QDockWidget("🛠 Разработчик", self)
+        self.dev_text = QTextEdit()
+        self.dev_text.setReadOnly(True)
+        self.dev_text.setFont(QFont("Consolas", 9))
+        dock.setWidget(self.dev_text)
+        dock.visibilityChanged.connect(lambda visible: visible and self.updateDevPanel())
+        return dock
+    
+    def toggleDevPanel(self):
+        self.dev_panel.setVisible(not self.dev_panel.isVisible())
+    
+    def updateDevPanel(self):
+        if not self.dev_panel.isVisible():
+            return
+        stats = self.view_stats
+        if not stats:
+            self.dev_text.setPlainText("Нет данных - откройте таблицу")
+            return
+        
+        text = "SQL\n" + "=" * 50 + f"\n{stats['sql']}\n\n"
+        text += "ПЛАН\n" + "=" * 50 + "\n"
+        try:
+            plan = self.queryPlan(stats['sql'])
+            depth = {0: -1}
+            for node, parent, detail in plan:
+                depth[node] = depth.get(parent, -1) + 1
+                text += "  " * depth[node] + f"└ {detail}\n"
+        except sqlite3.Error as e:
+            text += f"{e}\n"
+        
+        total = stats['prepare'] + stats['fetch'] + stats['render']
+        text += "\nВРЕМЯ\n" + "=" * 50 + "\n"
+        for title, key in (("Подготовка", 'prepare'), ("Выполнение и выборка", 'fetch'),
+                           ("Заполнение грида", 'render')):
+            share = stats[key] / total * 100 if total else 0
+            text += f"{title:<22}{stats[key] * 1000:>10.1f} мс  {share:5.1f}%\n"
+        text += f"{'Всего':<22}{total * 1000:>10.1f} мс\n"
+        
+        text += "\nДАННЫЕ\n" + "=" * 50 + "\n"
+        text += f"Строк: {stats['rows']:,} | Колонок: {stats['cols']}\n"
+        text += f"Получено: {stats['bytes'] / 1024:,.1f} КБ"
+        text += " (из кэша)\n" if stats.get('cached') else "\n"
+        text += (f"Кэш результатов: {len(self.result_cache.items)}/{self.result_cache.entries}, "
+                 f"{self.result_cache.size / 1048576:,.1f} МБ\n")
+        
+        text += "\nИНСТРУКЦИИ ЗА ОБНОВЛЕНИЕ\n" + "=" * 50 + "\n"
+        if not self.tracer:
+            text += "Трассировка выключена (Ctrl+Shift+T)\n"
+        else:
+            counts = stats.get('statements') or Counter()
+            text += f"Всего: {sum(counts.values())}\n"
+            for sql, n in counts.most_common():
+                text += f"{n:>6}  {sql[:120]}\n"
+        self.dev_text.setPlainText(text)
+    
     def setupHotkeys(self):
         shortcuts = [
             ("F5", self.refreshData),
@@ -782,10 +1506,18 @@ class ModernDatabaseApp(QMainWindow):
             ("Ctrl+P", self.printData),
             ("Return", self.onEnter),
             ("Ctrl+I", self.quickAddPhoto),
-            ("Ctrl+V", self.viewPhoto)
+            ("Ctrl+V", self.viewPhoto),
+            ("Ctrl+Shift+V", self.pasteBlock),
+            ("F12", self.toggleDevPanel),
+            ("Ctrl+Shift+T", self.toggleTracing)
         ]
         for key, callback in shortcuts:
             QShortcut(QKeySequence(key), self).activated.connect(callback)
+        
+        # Копирование - только когда фокус в гриде, чтобы не мешать полям ввода
+        copy = QShortcut(QKeySequence("Ctrl+C"), self.table)
+        copy.setContext(Qt.ShortcutContext.WidgetShortcut)
+        copy.activated.connect(self.copySelection)
     
     def onEnter(self):
         w = self.focusWidget()
@@ -815,25 +1547,159 @@ class ModernDatabaseApp(QMainWindow):
     
     def connectToDB(self):
         try:
-            self.connection = sqlite3.connect(self.db_name)
+            timeout = CONNECTION_PROFILES[self.profile]['pragmas']['busy_timeout'] / 1000
+            self.connection = sqlite3.connect(self.db_name, timeout=timeout, factory=TracedConnection)
+            self.attachTracer()
+            self.photo_store = PhotoStore(self.db_name)
+            self.connection.create_function("vavko_photo", 1, self.photo_store.read, deterministic=True)
+            self.result_cache.clear()
+            self.snapshot = None
+            self.row_counts = {}
             self.connection.execute("PRAGMA foreign_keys = ON")
+            self.applyPragmas(CONNECTION_PROFILES[self.profile]['pragmas'])
+            self.read_pool = ReadPool(self.db_name)
             self.updateTableList()
             self.db_label.setText(f"База: {os.path.basename(self.db_name)}")
             self.updateStatus(f"✅ Подключено к {os.path.basename(self.db_name)}")
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка", str(e))
     
+    def attachTracer(self):
+        if not self.connection:
+            return
+        self.connection.tracer = self.tracer
+        self.connection.set_trace_callback(self.tracer.trace if self.tracer else None)
+    
+    def toggleTracing(self):
+        """Включает/выключает журнал медленных запросов и счётчики инструкций"""
+        if self.tracer:
+            self.tracer.close()
+            self.tracer = None
+            self.updateStatus("⏹ Трассировка выключена")
+        else:
+            path = os.path.join(os.path.dirname(os.path.abspath(self.db_name or ".")), SLOW_LOG_FILE)
+            self.tracer = QueryTracer(path)
+            self.updateStatus(f"⏺ Трассировка: медленнее {SLOW_QUERY_MS} мс -> {path}")
+        self.attachTracer()
+        self.updateDevPanel()
+    
+    def applyPragmas(self, pragmas):
+        """Устанавливает PRAGMA и возвращает их прежние значения"""
+        # journal_mode нельзя менять внутри транзакции
+        self.connection.commit()
+        previous = {}
+        for key, val in pragmas.items():
+            previous[key] = self.connection.execute(f"PRAGMA {key}").fetchone()[0]
+            self.connection.execute(f"PRAGMA {key} = {val}")
+        return previous
+    
+    def changeProfile(self):
+        profile = self.profile_combo.currentData()
+        if not self.connection:
+            self.profile = profile
+            return
+        try:
+            # Сбрасываем query_only, иначе он останется от профиля отчётов
+            self.connection.execute("PRAGMA query_only = OFF")
+            # Открытые читатели пула не дают сменить journal_mode ("database is locked")
+            if self.read_pool:
+                self.read_pool.closeIdle()
+            self.applyPragmas(CONNECTION_PROFILES[profile]['pragmas'])
+        except sqlite3.Error as e:
+            # Профиль применился не целиком - возвращаем прежний и в подключении, и в списке
+            try:
+                self.applyPragmas(CONNECTION_PROFILES[self.profile]['pragmas'])
+            except sqlite3.Error:
+                pass
+            self.profile_combo.blockSignals(True)
+            self.profile_combo.setCurrentIndex(self.profile_combo.findData(self.profile))
+            self.profile_combo.blockSignals(False)
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        self.profile = profile
+        self.updateStatus(f"✅ Профиль: {CONNECTION_PROFILES[self.profile]['title']}")
+    
+    @contextmanager
+    def tunedFor(self, profile):
+        """Временно переключает подключение на профиль на время тяжёлой операции.
+
+        Меняются только synchronous, кэш и temp_store: journal_mode выбран для
+        файла (DELETE на сетевом диске) и при открытых читателях не переключается."""
+        pragmas = CONNECTION_PROFILES[profile]['pragmas']
+        previous = self.applyPragmas({key: pragmas[key] for key in TUNED_PRAGMAS if key in pragmas})
+        try:
+            yield
+        except:
+            # Незавершённые изменения не должны попасть в commit при возврате PRAGMA
+            self.connection.rollback()
+            raise
+        finally:
+            self.applyPragmas(previous)
+    
+    def runInBackground(self, fn, on_done, on_progress=None):
+        """Запускает fn(conn, progress) на соединении из пула чтения"""
+        task = PoolTask(self.read_pool, fn, self)
+        task.done.connect(on_done)
+        task.failed.connect(lambda msg: QMessageBox.critical(self, "Ошибка", msg))
+        if on_progress:
+            task.progress.connect(on_progress)
+        task.finished.connect(lambda: self.tasks.discard(task))
+        self.tasks.add(task)
+        task.start()
+        return task
+    
+    def runWriteInBackground(self, fn, on_done, on_progress=None):
+        """Запускает fn(conn, progress) на отдельном пишущем соединении"""
+        # Открытая транзакция основного соединения заблокировала бы фоновую запись
+        self.connection.commit()
+        task = WriteTask(self.db_name, fn, self.profile, self)
+        task.done.connect(on_done)
+        task.failed.connect(lambda msg: QMessageBox.critical(self, "Ошибка", msg))
+        if on_progress:
+            task.progress.connect(on_progress)
+        task.finished.connect(lambda: self.tasks.discard(task))
+        self.tasks.add(task)
+        task.start()
+        return task
+    
+    def closeReadPool(self):
+        # Долгие задачи (пережатие) проверяют прерывание между порциями - иначе окно ждало бы их до конца
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.requestInterruption()
+        for task in tasks:
+            task.wait()
+        if self.read_pool:
+            self.read_pool.close()
+            self.read_pool = None
+    
+    def optimizeDB(self):
+        """PRAGMA optimize перед закрытием: SQLite сам решает, для каких индексов нужен ANALYZE"""
+        if self.connection:
+            try:
+                self.connection.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+    
+    def closeEvent(self, event):
+        # Сначала останавливаем фоновые записи: PRAGMA optimize иначе ждал бы их блокировку
+        self.closeReadPool()
+        self.optimizeDB()
+        if self.tracer:
+            self.tracer.close()
+        super().closeEvent(event)
+    
     def changeDB(self):
         if QMessageBox.question(self, "Смена БД", "Сменить базу?") == QMessageBox.StandardButton.Yes:
+            self.closeReadPool()
+            self.optimizeDB()
             if self.connection:
                 self.connection.close()
             self.selectDatabase()
     
     def updateTableList(self):
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [t[0] for t in cursor.fetchall() if t[0] != "sqlite_sequence"]
+            tables = self.userTables(self.connection.cursor())
             self.table_list.clear()
             self.table_list.addItems(tables)
         except sqlite3.Error as e:
@@ -867,6 +1733,8 @@ class ModernDatabaseApp(QMainWindow):
             text = f"Основная: {self.current_table}\n"
             for i, j in enumerate(self.joined_tables, 1):
                 text += f"{i}. {j['table2']}\n   {j['condition']} [{j['join_type']}]\n"
+                if j.get('limit'):
+                    text += f"   ⚠ LIMIT {j['limit']:,}\n"
         else:
             text = "Нет соединений"
         self.join_info.setText(text)
@@ -950,21 +1818,148 @@ class ModernDatabaseApp(QMainWindow):
         if not cols:
             return "", []
         
-        select = "SELECT " + ", ".join(cols)
-        from_clause = f"FROM {main}"
-        joins = []
-        for j in self.joined_tables:
-            t = self.escape(j['table2'])
-            joins.append(f"{j.get('join_type', 'INNER')} JOIN {t} ON {j['condition']}")
+        select = "SELECT " + ", ".join(self.resolvePhotoRefs(cols))
+        from_clause, limit = self.joinClauses()
         
         order = ""
         if sort_col:
             order = f"ORDER BY {self.escape(sort_col)} {'DESC' if sort_order == 'По убыванию' else 'ASC'}"
         
-        query = f"{select} {from_clause} {' '.join(joins)} {order}".strip()
+        query = f"{select} {from_clause} {order} {limit}".strip()
         display = [c.replace('"', '').split('.')[-1] for c in cols]
+        
+        snapshot = self.activeSnapshot()
+        if snapshot and all(d in snapshot['cols'] for d in display):
+            query = self.snapshotQuery(display, sort_col, sort_order)
         return query, display
     
+    def joinClauses(self):
+        """FROM со всеми JOIN и LIMIT текущего соединения"""
+        joins = [f"FROM {self.escape(self.current_table)}"]
+        for j in self.joined_tables:
+            joins.append(f"{j.get('join_type', 'INNER')} JOIN {self.escape(j['table2'])} ON {j['condition']}")
+        limits = [j['limit'] for j in self.joined_tables if j.get('limit')]
+        return " ".join(joins), f"LIMIT {min(limits)}" if limits else ""
+    
+    def joinSignature(self):
+        return (self.current_table, tuple((j['table2'], j['condition'], j.get('join_type'), j.get('limit'))
+                                          for j in self.joined_tables))
+    
+    def dataVersion(self):
+        """Меняется при любой записи в базу: чужой (data_version) или своей (total_changes)"""
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, self.connection.total_changes
+    
+    def activeSnapshot(self):
+        """Снимок текущего соединения, если он ещё актуален; устаревший удаляется"""
+        if not self.snapshot:
+            return None
+        if self.snapshot['signature'] == self.joinSignature() and self.snapshot['version'] == self.dataVersion():
+            return self.snapshot
+        self.dropSnapshot()
+        self.updateStatus("📌 Снимок устарел - данные читаются из исходных таблиц")
+        return None
+    
+    def snapshotQuery(self, display, sort_col=None, sort_order="ASC"):
+        table = self.escape(SNAPSHOT_TABLE)
+        photos = self.snapshot['photos']
+        select = []
+        for d in display:
+            if d not in photos:
+                select.append(self.escape(d))
+                continue
+            # Фото читаются из исходной таблицы по rowid, сохранённому в снимке
+            source, key, col = photos[d]
+            sql = f"{self.escape(source)}.{self.escape(col)}"
+            info = {'sql': sql, 'table': source, 'name': col}
+            value = self.resolvePhotoRefs([sql], {d: info})[0].rsplit(" AS ", 1)[0]
+            select.append(f"(SELECT {value} FROM {self.escape(source)} "
+                          f"WHERE rowid = {table}.{self.escape(key)}) AS {self.escape(d)}")
+        query = f"SELECT {', '.join(select)} FROM temp.{table}"
+        if sort_col in self.snapshot['cols']:
+            if sort_col not in photos:
+                self.ensureSnapshotIndex(sort_col)
+            query += f" ORDER BY {self.escape(sort_col)} {'DESC' if sort_order == 'По убыванию' else 'ASC'}"
+        return query
+    
+    def ensureSnapshotIndex(self, col):
+        """Индексы снимка строятся по первой сортировке колонки и переиспользуются"""
+        if col in self.snapshot['indexed']:
+            return
+        name = self.escape(f"{SNAPSHOT_TABLE}_{self.snapshot['cols'].index(col)}")
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS temp.{name} "
+                                f"ON {self.escape(SNAPSHOT_TABLE)}({self.escape(col)})")
+        self.snapshot['indexed'].add(col)
+        self.snapshot['version'] = self.dataVersion()
+    
+    def dropSnapshot(self):
+        self.snapshot = None
+        self.snapshot_btn.setText("📌 Снимок")
+        # Создание и удаление TEMP-таблицы не меняет версий базы в ключе кэша,
+        # а следующий снимок с тем же текстом запроса может хранить другие строки
+        self.result_cache.clear()
+        try:
+            self.connection.execute(f"DROP TABLE IF EXISTS temp.{self.escape(SNAPSHOT_TABLE)}")
+        except sqlite3.Error:
+            pass
+    
+    def toggleSnapshot(self):
+        if self.snapshot:
+            self.dropSnapshot()
+            self.displayTableData(*self.view_sort)
+            self.updateStatus("📌 Снимок удалён")
+            return
+        if not self.joined_tables:
+            QMessageBox.information(self, "Информация", "Снимок нужен для соединённых таблиц")
+            return
+        
+        # В снимок попадают все колонки соединения, чтобы смена атрибутов тоже шла по нему
+        attrs, self.selected_attributes = self.selected_attributes, []
+        try:
+            _, cols = self.buildQuery()
+        finally:
+            self.selected_attributes = attrs
+        
+        # Фото не копируются: TEMP-таблица живёт в памяти (temp_store=MEMORY), поэтому
+        # снимок хранит rowid строк с фото, а байты читаются из исходной таблицы
+        cursor = self.connection.cursor()
+        photo_cols, keys, photos, select, kept = {}, {}, {}, [], []
+        for name in cols:
+            info = self.column_mapping[name]
+            table = info['table']
+            if table not in photo_cols:
+                photo_cols[table] = self.photoColumns(cursor, table)
+            if info['name'] not in photo_cols[table]:
+                select.append(f"{info['sql']} AS {self.escape(name)}")
+            elif table in keys or self.hasRowid(table):
+                if table not in keys:
+                    keys[table] = f"{SNAPSHOT_TABLE}_rowid_{len(keys)}"
+                    select.append(f"{self.escape(table)}.rowid AS {self.escape(keys[table])}")
+                photos[name] = (table, keys[table], info['name'])
+            else:
+                continue  # WITHOUT ROWID: такие фото читаются без снимка
+            kept.append(name)
+        from_clause, limit = self.joinClauses()
+        query = f"SELECT {', '.join(select)} {from_clause} {limit}"
+        
+        if self.query_running:
+            return
+        built = False
+        with self.queryProgress("Создание снимка соединения..."):
+            self.connection.execute(f"DROP TABLE IF EXISTS temp.{self.escape(SNAPSHOT_TABLE)}")
+            self.connection.execute(f"CREATE TEMP TABLE {self.escape(SNAPSHOT_TABLE)} AS {query}")
+            built = True
+        if not built:
+            self.updateStatus("⛔ Создание снимка отменено")
+            return
+        
+        self.result_cache.clear()
+        self.snapshot = {'signature': self.joinSignature(), 'cols': kept, 'photos': photos, 'indexed': set(),
+                         'version': self.dataVersion()}
+        self.snapshot_btn.setText("📌 Снимок ✓")
+        self.displayTableData(*self.view_sort)
+        self.updateStatus(f"📌 Снимок соединения: {len(kept)} колонок")
+    
     def isImageColumn(self, name):
         try:
             cursor = self.connection.cursor()
@@ -978,35 +1973,365 @@ class ModernDatabaseApp(QMainWindow):
                 for col in cursor.fetchall():
                     if col[1] == name and col[2].upper() == 'BLOB':
                         return True
-            keywords = ['photo', 'image', 'img', 'picture', 'pic', 'фото']
-            return any(k in name.lower() for k in keywords)
+            return any(k in name.lower() for k in PHOTO_KEYWORDS)
         except:
             return False
     
+    def photoColumns(self, cursor, table):
+        """Колонки таблицы с фото: тип BLOB или имя как у фото (правило isImageColumn)"""
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        return [c[1] for c in cursor.fetchall()
+                if (c[2] or "").upper() == 'BLOB' or any(k in c[1].lower() for k in PHOTO_KEYWORDS)]
+    
+    def userTables(self, cursor):
+        """Таблицы пользователя: без служебных sqlite_* и vavko_* (хранилище фото, хеши, точки продолжения)"""
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' "
+                       "AND name NOT LIKE 'vavko\\_%' ESCAPE '\\'")
+        return [t[0] for t in cursor.fetchall()]
+    
+    def referencedPhotos(self, conn, prefix):
+        """Имена, на которые ссылаются ячейки фото всех таблиц: хеши (photo:sha256:) или файлы (photo:file:)"""
+        cursor = conn.cursor()
+        names = set()
+        for table in self.userTables(cursor):
+            for col in self.photoColumns(cursor, table):
+                c = self.escape(col)
+                names.update(r[0] for r in conn.execute(
+                    f"SELECT DISTINCT substr({c}, ?) FROM {self.escape(table)} "
+                    f"WHERE typeof({c}) = 'text' AND substr({c}, 1, ?) = ?",
+                    (len(prefix) + 1, len(prefix), prefix)))
+        return names
+    
+    def resolvePhotoValue(self, conn, value):
+        """Байты фото по значению ячейки: BLOB как есть, ссылки photo:sha256: и photo:file:
+        разрешаются через общую таблицу и внешнее хранилище. None, если фото нет.
+
+        Безопасно вызывать из фоновых потоков со своим соединением."""
+        if isinstance(value, bytes):
+            return value
+        if not isinstance(value, str):
+            return None
+        if value.startswith(PHOTO_REF_PREFIX):
+            try:
+                row = conn.execute(f"SELECT data FROM {self.escape(PHOTO_STORE_TABLE)} WHERE hash = ?",
+                                   (value[len(PHOTO_REF_PREFIX):],)).fetchone()
+            except sqlite3.Error:
+                return None
+            return row[0] if row else None
+        if value.startswith(PHOTO_FILE_PREFIX) and self.photo_store:
+            return self.photo_store.read(value)
+        return None
+    
+    def storePhotoValue(self, conn, like, data):
+        """Значение ячейки для новых байтов фото в том же виде, что и like:
+        ссылка в общую таблицу, файл во внешнем хранилище или BLOB"""
+        if isinstance(like, str) and like.startswith(PHOTO_REF_PREFIX):
+            digest = hashlib.sha256(data).hexdigest()
+            conn.execute(f"INSERT OR IGNORE INTO {self.escape(PHOTO_STORE_TABLE)} (hash, data, size) "
+                         "VALUES (?, ?, ?)", (digest, data, len(data)))
+            return PHOTO_REF_PREFIX + digest
+        if isinstance(like, str) and like.startswith(PHOTO_FILE_PREFIX):
+            return self.photo_store.put(data)
+        return data
+    
+    def hasPhotoStore(self):
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                       (PHOTO_STORE_TABLE,)).fetchone() is not None
+    
+    def resolvePhotoRefs(self, cols, mapping=None):
+        """Подставляет байты вместо ссылок в колонках фото.
+
+        photo:sha256:... берутся из общей таблицы, photo:file:... - из внешнего
+        хранилища через функцию vavko_photo. mapping - описание колонок, если
+        это не колонки текущего запроса (column_mapping)."""
+        branches = []
+        if self.hasPhotoStore():
+            branches.append((PHOTO_REF_PREFIX, "(SELECT data FROM {store} WHERE hash = substr({c}, {n}))"))
+        if self.photo_store and self.photo_store.enabled():
+            branches.append((PHOTO_FILE_PREFIX, "vavko_photo({c})"))
+        if not branches:
+            return cols
+        cursor = self.connection.cursor()
+        photo_cols = {}
+        photo = {}
+        for info in (mapping or self.column_mapping).values():
+            if info['table'] not in photo_cols:
+                photo_cols[info['table']] = self.photoColumns(cursor, info['table'])
+            photo[info['sql']] = info['name'] in photo_cols[info['table']]
+        store = self.escape(PHOTO_STORE_TABLE)
+        resolved = []
+        for c in cols:
+            if not photo.get(c):
+                resolved.append(c)
+                continue
+            name = self.escape(c.replace('"', '').split('.')[-1])
+            whens = " ".join(f"WHEN {c} LIKE '{prefix}%' THEN " + expr.format(store=store, c=c, n=len(prefix) + 1)
+                             for prefix, expr in branches)
+            # typeof() не читает содержимое BLOB, обычные фото проходят без лишних копий
+            resolved.append(f"CASE WHEN typeof({c}) != 'text' THEN {c} {whens} ELSE {c} END AS {name}")
+        return resolved
+    
     def isValidImage(self, data):
-        if not isinstance(data, bytes) or len(data) < 100:
-            return False
+        return isinstance(data, bytes) and len(data) >= 100 and imageFormat(data) is not None
+    
+    @contextmanager
+    def queryProgress(self, text="Выполнение запроса..."):
+        """Индикатор времени и кнопка отмены на время запроса к основному соединению.
+
+        Обработчик прогресса SQLite держит интерфейс живым, отмена вызывает
+        Connection.interrupt(). После отмены ошибка SQLite гасится, а
+        state['canceled'] становится True.
+
+        Пока идёт запрос, ввод пользователя не обрабатывается (кроме окна
+        индикатора), а вложенные запросы отклоняются через query_running:
+        повторный вход в SQLite посреди шага снял бы обработчик отмены."""
+        progress = QProgressDialog(text, "⛔ Отмена", 0, 0, self)
+        progress.setWindowTitle("Запрос")
+        progress.setWindowModality(Qt.WindowModality.ApplicationModal)
+        progress.setMinimumDuration(QUERY_PROGRESS_DELAY_MS)
+        progress.canceled.connect(self.connection.interrupt)
+        
+        started = time.monotonic()
+        state = {'steps': 0, 'rows': 0, 'canceled': False}
+        
+        def tick():
+            state['steps'] += QUERY_PROGRESS_STEPS
+            progress.setLabelText(f"{text}\n⏱ {time.monotonic() - started:.1f} с\n"
+                                  f"Операций: {state['steps']:,} | Строк: {state['rows']:,}")
+            # До появления индикатора клики и горячие клавиши откладываются
+            QApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents if progress.isVisible()
+                                       else QEventLoop.ProcessEventsFlag.ExcludeUserInputEvents)
+            return 1 if progress.wasCanceled() else 0
+        
+        self.query_running = True
+        self.connection.set_progress_handler(tick, QUERY_PROGRESS_STEPS)
         try:
-            sig = data[:6]
-            return (sig.startswith(b'\xff\xd8\xff') or sig.startswith(b'\x89PNG') or
-                    sig.startswith(b'GIF87a') or sig.startswith(b'GIF89a') or sig.startswith(b'BM'))
-        except:
-            return False
+            yield state
+        except sqlite3.OperationalError:
+            if not progress.wasCanceled():
+                raise
+            state['canceled'] = True
+        finally:
+            self.connection.set_progress_handler(None, 0)
+            self.query_running = False
+            progress.close()
+    
+    def runQuery(self, query, params=()):
+        """Выполняет SELECT с индикатором времени и кнопкой отмены.
+
+        Возвращает None при отмене и если уже выполняется другой запрос.
+        Неизменившиеся результаты берутся из кэша без обращения к SQLite."""
+        if self.query_running:
+            return None
+        started = time.monotonic()
+        key = self.resultCacheKey(query, params)
+        hit = self.result_cache.get(key)
+        if hit:
+            rows, size = hit
+            self.last_query = {'sql': query, 'prepare': 0, 'fetch': time.monotonic() - started,
+                               'rows': len(rows), 'bytes': size, 'cached': True}
+            return list(rows)
+        
+        rows = None
+        with self.queryProgress() as state:
+            cursor = self.connection.cursor()
+            # EXPLAIN компилирует тот же запрос, не выполняя его - это время подготовки
+            cursor.execute(f"EXPLAIN {query}", params).fetchall()
+            prepared = time.monotonic()
+            cursor.execute(query, params)
+            fetched = []
+            size = 0
+            while True:
+                chunk = cursor.fetchmany(COPY_CHUNK_ROWS)
+                if not chunk:
+                    break
+                fetched.extend(chunk)
+                size += sum(len(v) if isinstance(v, (bytes, str)) else 8
+                            for row in chunk for v in row if v is not None)
+                state['rows'] = len(fetched)
+            self.last_query = {'sql': query, 'prepare': prepared - started,
+                               'fetch': time.monotonic() - prepared, 'rows': len(fetched), 'bytes': size}
+            self.result_cache.put(key, tuple(fetched), size)
+            rows = fetched
+        return rows
+    
+    def resultCacheKey(self, query, params=()):
+        """Ключ кэша: текст запроса и всё, что меняется при записи в базу.
+
+        data_version растёт при коммитах других соединений, total_changes -
+        при своих изменениях (в том числе незакоммиченных), schema_version - при DDL."""
+        schema_version = self.connection.execute("PRAGMA schema_version").fetchone()[0]
+        return (query, tuple(params), schema_version) + self.dataVersion()
+    
+    def queryPlan(self, query, params=()):
+        """Строки EXPLAIN QUERY PLAN: (id, parent, detail)"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        return [(r[0], r[1], r[-1]) for r in cursor.fetchall()]
+    
+    def indexedColumns(self, table):
+        """Колонки, с которых начинается какой-либо индекс таблицы (включая rowid-ключ)"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA index_list({self.escape(table)})")
+        cols = set()
+        for idx in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_info({self.escape(idx[1])})")
+            info = cursor.fetchall()
+            if info:
+                cols.add(info[0][2])
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        pk = [c for c in cursor.fetchall() if c[5]]
+        if len(pk) == 1 and pk[0][2].upper() == "INTEGER":
+            cols.add(pk[0][1])
+        return cols
+    
+    def adviseIndexes(self, query):
+        """Колонки соединений и сортировки, которые SQLite перебирает полным сканированием.
+
+        Возвращает список (таблица, колонка, причина)."""
+        plan = [d for _, _, d in self.queryPlan(query)]
+        scans = []
+        automatic = set()
+        for d in plan:
+            m = re.match(r"SCAN (?:TABLE )?(.+?)(?: USING .*)?$", d)
+            if m and "USING INDEX" not in d and "COVERING INDEX" not in d:
+                scans.append(m.group(1))
+            m = re.match(r"SEARCH (?:TABLE )?(.+?) USING AUTOMATIC", d)
+            if m:
+                automatic.add(m.group(1))
+        # Первое сканирование - внешний цикл, индекс по колонке соединения ему не поможет
+        inner = set(scans[1:]) | automatic
+        
+        candidates = []
+        for j in self.joined_tables:
+            if 'columns' in j:
+                candidates.append((self.current_table, j['columns'][0], "соединение"))
+                candidates.append((j['table2'], j['columns'][1], "соединение"))
+        
+        sort_col = self.view_sort[0]
+        if sort_col and any("TEMP B-TREE FOR ORDER BY" in d for d in plan):
+            info = self.column_mapping.get(sort_col)
+            if info:
+                candidates.append((info['table'], info['name'], "сортировка"))
+        
+        advice = []
+        for table, col, reason in candidates:
+            if reason == "соединение" and table not in inner:
+                continue
+            if col in self.indexedColumns(table):
+                continue
+            if not any(a[:2] == (table, col) for a in advice):
+                advice.append((table, col, reason))
+        return advice
+    
+    def updateIndexAdvice(self, query):
+        try:
+            self.index_suggestions = self.adviseIndexes(query)
+        except sqlite3.Error:
+            self.index_suggestions = []
+        if self.index_suggestions:
+            self.index_btn.setText(f"⚡ Индексы ({len(self.index_suggestions)})")
+            self.index_btn.setToolTip("Без индекса: " + ", ".join(
+                f"{t}.{c} ({r})" for t, c, r in self.index_suggestions))
+        else:
+            self.index_btn.setText("⚡ Индексы")
+            self.index_btn.setToolTip("")
+    
+    def listIndexes(self):
+        """Индексы базы: (имя, таблица, колонки, размер в байтах или None)"""
+        cursor = self.connection.cursor()
+        sizes = {}
+        try:
+            cursor.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+            sizes = dict(cursor.fetchall())
+        except sqlite3.Error:
+            pass  # SQLite собран без SQLITE_ENABLE_DBSTAT_VTAB
+        
+        cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name")
+        result = []
+        for name, table in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_info({self.escape(name)})")
+            cols = ", ".join(str(c[2]) for c in cursor.fetchall())
+            result.append((name, table, cols, sizes.get(name)))
+        return result
+    
+    def manageIndexes(self):
+        if not self.connection:
+            QMessageBox.warning(self, "Предупреждение", "Нет подключения")
+            return
+        try:
+            indexes = self.listIndexes()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        
+        dlg = IndexManagerDialog(self, indexes, self.index_suggestions)
+        if dlg.exec():
+            suggestion = dlg.getSelectedSuggestion()
+            if suggestion:
+                self.createIndex(*suggestion[:2])
+    
+    def createIndex(self, table, col):
+        """Строит индекс в фоне с индикатором; грид обновляется по готовности"""
+        name = re.sub(r"\W", "_", f"idx_{table}_{col}")
+        sql = f"CREATE INDEX IF NOT EXISTS {self.escape(name)} ON {self.escape(table)}({self.escape(col)})"
+        
+        progress = QProgressDialog(f"Создание индекса {name}...", None, 0, 0, self)
+        progress.setWindowTitle("Индекс")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(QUERY_PROGRESS_DELAY_MS)
+        started = time.monotonic()
+        
+        def build(conn, report):
+            ticks = [0]
+            
+            def tick():
+                ticks[0] += 1
+                report(ticks[0], name)
+                return 0
+            
+            conn.set_progress_handler(tick, QUERY_PROGRESS_STEPS)
+            conn.execute(sql)
+            conn.execute(f"ANALYZE {self.escape(name)}")
+            return name
+        
+        def on_progress(ticks, _):
+            progress.setLabelText(f"Создание индекса {name}...\n"
+                                  f"⏱ {time.monotonic() - started:.1f} с | "
+                                  f"Операций: {ticks * QUERY_PROGRESS_STEPS:,}")
+        
+        def on_done(_):
+            progress.close()
+            self.updateStatus(f"✅ Индекс {name} создан")
+            if self.current_table:
+                self.displayTableData(*self.view_sort)
+        
+        task = self.runWriteInBackground(build, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
     
     def displayTableData(self, sort_col=None, sort_order="ASC"):
         if not self.current_table and not self.joined_tables:
             return
+        if self.query_running:
+            # Вложенный вызов из обработчика прогресса затёр бы заполняемую таблицу
+            return
         
+        if self.tracer:
+            self.tracer.mark()
         try:
             self.table.clear()
+            self.view_sort = (sort_col, sort_order)
             query, cols = self.buildQuery(sort_col, sort_order)
             if not cols:
                 QMessageBox.warning(self, "Предупреждение", "Нет атрибутов")
                 return
             
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            rows = self.runQuery(query)
+            if rows is None:
+                self.updateStatus("⛔ Запрос отменён")
+                return
+            self.updateIndexAdvice(query)
+            render_started = time.monotonic()
             
             self.table.setRowCount(len(rows))
             self.table.setColumnCount(len(cols))
@@ -1062,6 +2387,12 @@ class ModernDatabaseApp(QMainWindow):
             
             self.table.resizeRowsToContents()
             self.fixPhotoRowHeights()
+            self.view_stale = False
+            
+            self.view_stats = dict(self.last_query, cols=len(cols),
+                                   render=time.monotonic() - render_started,
+                                   statements=self.tracer.sinceMark() if self.tracer else None)
+            self.updateDevPanel()
                 
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка", str(e))
@@ -1080,6 +2411,7 @@ class ModernDatabaseApp(QMainWindow):
         
         add = menu.addAction("📷 Добавить фото")
         view = menu.addAction("🖼️ Просмотреть")
+        gallery = menu.addAction("🗂 Галерея колонки")
         rem = menu.addAction("🗑️ Удалить")
         
         action = menu.exec(QCursor.pos())
@@ -1087,6 +2419,8 @@ class ModernDatabaseApp(QMainWindow):
             self.addPhotoDialog(name, r, c)
         elif action == view:
             self.viewSelectedImage()
+        elif action == gallery:
+            self.openGallery(name)
         elif action == rem:
             self.removePhoto(r, c, name)
     
@@ -1101,6 +2435,36 @@ class ModernDatabaseApp(QMainWindow):
         if self.table.cellWidget(r, c):
             return
         
+        if not self.isImageColumn(name):
+            menu = QMenu()
+            menu.setFont(QFont("Arial", 10))
+            
+            cell = menu.addAction("📋 Копировать ячейку")
+            sel_tsv = menu.addAction("📋 Копировать выделение (TSV)")
+            sel_csv = menu.addAction("📋 Копировать выделение (CSV)")
+            row = menu.addAction("📋 Копировать строки")
+            header = menu.addAction("📋 Копировать заголовок")
+            menu.addSeparator()
+            whole = menu.addAction("📋 Копировать всю таблицу")
+            to_file = menu.addAction("💾 Выделение в файл...")
+            
+            action = menu.exec(self.table.viewport().mapToGlobal(pos))
+            if action == cell:
+                self.copyCell()
+            elif action == sel_tsv:
+                self.copySelection()
+            elif action == sel_csv:
+                self.copySelection("csv")
+            elif action == row:
+                self.copyRow()
+            elif action == header:
+                self.copyHeader()
+            elif action == whole:
+                self.copyTable()
+            elif action == to_file:
+                self.copyToFile(*self.selectionRange())
+            return
+        
         has_photo = bool(item.data(Qt.ItemDataRole.UserRole))
         
         if self.isImageColumn(name):
@@ -1200,38 +2564,51 @@ class ModernDatabaseApp(QMainWindow):
             pass
         return None
     
+    def findKeyColumn(self, table):
+        """Ключ таблицы (первая колонка) и его индекс в гриде, -1 если не показан"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        pk = cursor.fetchall()[0][1]
+
+        for i in range(self.table.columnCount()):
+            h = self.table.horizontalHeaderItem(i).text()
+            clean = h.split('.')[-1] if '.' in h else h
+            if clean == pk:
+                info = self.getColumnInfo(h)
+                if info and info['table'] == table:
+                    return pk, i
+        return pk, -1
+
+    def convertValue(self, typ, val):
+        """Приводит введённое значение к типу колонки"""
+        typ = (typ or "").upper()
+        if typ == 'BOOLEAN':
+            return 1 if str(val).lower() in ['true', '1', 'да', 'yes'] else 0
+        if typ in ['INTEGER', 'REAL']:
+            try:
+                return float(val) if '.' in val else int(val)
+            except:
+                return val
+        return val
+
+    def selectedRows(self):
+        """Номера строк грида, в которых выделена хотя бы одна ячейка"""
+        return sorted({idx.row() for idx in self.table.selectedIndexes()})
+
     def updateCell(self, r, c, new_val, table, col):
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({self.escape(table)})")
-            pk = cursor.fetchall()[0][1]
-            
-            pk_idx = -1
-            for i in range(self.table.columnCount()):
-                h = self.table.horizontalHeaderItem(i).text()
-                clean = h.split('.')[-1] if '.' in h else h
-                if clean == pk:
-                    info = self.getColumnInfo(h)
-                    if info and info['table'] == table:
-                        pk_idx = i
-                        break
-            
+            pk, pk_idx = self.findKeyColumn(table)
+
             if pk_idx == -1:
                 QMessageBox.critical(self, "Ошибка", f"Не найден ключ {pk}")
                 return
-            
+
             pk_val = self.table.item(r, pk_idx).text()
-            
+
             typ = self.getColumnType(table, col)
-            processed = new_val
-            if typ and typ.upper() == 'BOOLEAN':
-                processed = 1 if str(new_val).lower() in ['true', '1', 'да', 'yes'] else 0
-            elif typ and typ.upper() in ['INTEGER', 'REAL']:
-                try:
-                    processed = float(new_val) if '.' in new_val else int(new_val)
-                except:
-                    processed = new_val
-            
+            processed = self.convertValue(typ, new_val)
+
+            cursor = self.connection.cursor()
             query = f"UPDATE {self.escape(table)} SET {self.escape(col)} = ? WHERE {pk} = ?"
             cursor.execute(query, (processed, pk_val))
             self.connection.commit()
@@ -1242,6 +2619,7 @@ class ModernDatabaseApp(QMainWindow):
             else:
                 item.setText(str(new_val))
             
+            self.view_stale = True
             self.updateStatus(f"✅ Обновлено {table}")
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка", str(e))
@@ -1340,11 +2718,35 @@ class ModernDatabaseApp(QMainWindow):
             QMessageBox.warning(self, "Предупреждение", "Нет фото")
     
     def addPhotoDialog(self, name, r, c):
-        dlg = PhotoDialog(self, name)
+        dlg = PhotoDialog(self, name, self.photo_settings)
         if dlg.exec():
             data = dlg.getImageData()
             if data:
-                self.updateImage(r, c, data, name)
+                self.photo_settings = dlg.getSettings()
+                try:
+                    data, thumb = self.ingestPhoto(data)
+                except Exception as e:
+                    QMessageBox.critical(self, "Ошибка", f"Не удалось обработать изображение: {e}")
+                    return
+                self.updateImage(r, c, data, name, thumb)
+    
+    def ingestPhoto(self, data):
+        """Нормализует фото перед записью; возвращает (изображение, миниатюра или None)"""
+        data = normalizeImage(data, self.photo_settings)
+        thumb = makeThumbnail(data) if self.photo_settings["thumbnail"] else None
+        return data, thumb
+    
+    def thumbColumn(self, table, name, create=False):
+        """Колонка миниатюр рядом с колонкой фото; с create=True добавляется при отсутствии"""
+        thumb = name + PHOTO_THUMB_SUFFIX
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        if thumb in [c[1] for c in cursor.fetchall()]:
+            return thumb
+        if not create:
+            return None
+        cursor.execute(f"ALTER TABLE {self.escape(table)} ADD COLUMN {self.escape(thumb)} BLOB")
+        return thumb
     
     def removePhoto(self, r, c, name):
         reply = QMessageBox.question(self, "Удаление", "Удалить фото?")
@@ -1366,18 +2768,24 @@ class ModernDatabaseApp(QMainWindow):
                 
                 pk_val = self.table.item(r, pk_idx).text()
                 
-                query = f"UPDATE {self.escape(self.current_table)} SET {self.escape(name)} = NULL WHERE {pk} = ?"
+                sets = f"{self.escape(name)} = NULL"
+                thumb = self.thumbColumn(self.current_table, name)
+                if thumb:
+                    sets += f", {self.escape(thumb)} = NULL"
+                query = f"UPDATE {self.escape(self.current_table)} SET {sets} WHERE {pk} = ?"
                 cursor.execute(query, (pk_val,))
                 self.connection.commit()
+                self.updatePhotoHash(self.current_table, name, pk, pk_val, None)
                 
                 self.table.removeCellWidget(r, c)
                 self.table.setItem(r, c, QTableWidgetItem(""))
                 
+                self.view_stale = True
                 self.updateStatus("✅ Фото удалено")
             except sqlite3.Error as e:
                 QMessageBox.critical(self, "Ошибка", str(e))
     
-    def updateImage(self, r, c, data, name):
+    def updateImage(self, r, c, data, name, thumb=None):
         try:
             cursor = self.connection.cursor()
             cursor.execute(f"PRAGMA table_info({self.escape(self.current_table)})")
@@ -1395,9 +2803,17 @@ class ModernDatabaseApp(QMainWindow):
             
             pk_val = self.table.item(r, pk_idx).text()
             
-            query = f"UPDATE {self.escape(self.current_table)} SET {self.escape(name)} = ? WHERE {pk} = ?"
-            cursor.execute(query, (data, pk_val))
+            value = self.photo_store.put(data) if self.photo_store.enabled() else data
+            sets, params = f"{self.escape(name)} = ?", [value]
+            thumb_col = self.thumbColumn(self.current_table, name, create=thumb is not None)
+            if thumb_col:
+                # Миниатюра старого фото не должна пережить замену
+                sets += f", {self.escape(thumb_col)} = ?"
+                params.append(thumb)
+            query = f"UPDATE {self.escape(self.current_table)} SET {sets} WHERE {pk} = ?"
+            cursor.execute(query, (*params, pk_val))
             self.connection.commit()
+            self.updatePhotoHash(self.current_table, name, pk, pk_val, data)
             
             self.table.removeCellWidget(r, c)
             w = ImageWidget(data, r, c)
@@ -1409,6 +2825,7 @@ class ModernDatabaseApp(QMainWindow):
             item.setData(Qt.ItemDataRole.UserRole, data)
             self.table.setItem(r, c, item)
             
+            self.view_stale = True
             self.updateStatus("✅ Фото обновлено")
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка", str(e))
@@ -1445,60 +2862,360 @@ class ModernDatabaseApp(QMainWindow):
         ImageViewDialog(self, name, data, info).exec()
     
     def deleteRecord(self):
-        items = self.table.selectedItems()
-        if not items:
+        rows = self.selectedRows()
+        if not rows:
             QMessageBox.warning(self, "Предупреждение", "Выберите запись")
             return
-        
-        if QMessageBox.question(self, "Подтверждение", "Удалить запись?") != QMessageBox.StandardButton.Yes:
+
+        text = "Удалить запись?" if len(rows) == 1 else f"Удалить записи ({len(rows)})?"
+        if QMessageBox.question(self, "Подтверждение", text) != QMessageBox.StandardButton.Yes:
             return
-        
+
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({self.escape(self.current_table)})")
-            pk = cursor.fetchall()[0][1]
-            
-            pk_idx = -1
-            for i in range(self.table.columnCount()):
-                if self.table.horizontalHeaderItem(i).text() == pk:
-                    pk_idx = i
-                    break
-            
+            pk, pk_idx = self.findKeyColumn(self.current_table)
+
             if pk_idx == -1:
                 QMessageBox.critical(self, "Ошибка", "Не найден ключ")
                 return
-            
-            pk_val = self.table.item(items[0].row(), pk_idx).text()
-            
-            cursor.execute(f"DELETE FROM {self.escape(self.current_table)} WHERE {pk} = ?", (pk_val,))
+
+            keys = list(dict.fromkeys(self.table.item(r, pk_idx).text() for r in rows))
+
+            # Один DELETE ... IN (...) на пачку ключей, всё в одной транзакции
+            cursor = self.connection.cursor()
+            for i in range(0, len(keys), SQL_BATCH_SIZE):
+                chunk = keys[i:i + SQL_BATCH_SIZE]
+                place = ", ".join(["?"] * len(chunk))
+                cursor.execute(f"DELETE FROM {self.escape(self.current_table)} "
+                               f"WHERE {self.escape(pk)} IN ({place})", chunk)
             self.connection.commit()
-            
-            self.table.removeRow(items[0].row())
-            self.updateStatus("✅ Запись удалена")
+
+            # В соединённом представлении одна запись может занимать несколько строк
+            deleted = set(keys)
+            for r in range(self.table.rowCount() - 1, -1, -1):
+                item = self.table.item(r, pk_idx)
+                if item and item.text() in deleted:
+                    self.table.removeRow(r)
+            self.updateStatus(f"✅ Удалено записей: {len(keys)}")
         except sqlite3.Error as e:
+            self.connection.rollback()
             QMessageBox.critical(self, "Ошибка", str(e))
-    
+
+    def bulkUpdate(self):
+        """Установка значения колонки для выделенных или всех показанных строк"""
+        if not self.current_table or not self.table.rowCount():
+            QMessageBox.warning(self, "Предупреждение", "Нет данных")
+            return
+
+        cols = []
+        for i in range(self.table.columnCount()):
+            name = self.table.horizontalHeaderItem(i).text()
+            if name not in self.image_columns:
+                cols.append(name)
+        if not cols:
+            QMessageBox.warning(self, "Предупреждение", "Нет атрибутов")
+            return
+
+        rows = self.selectedRows()
+        cur = self.table.currentColumn()
+        cur_name = self.table.horizontalHeaderItem(cur).text() if cur >= 0 else None
+
+        dlg = BulkUpdateDialog(self, cols, cur_name, len(rows), self.table.rowCount())
+        if not dlg.exec():
+            return
+
+        name, val, only_selected = dlg.getData()
+        if not only_selected:
+            rows = list(range(self.table.rowCount()))
+        if not rows:
+            QMessageBox.warning(self, "Предупреждение", "Выберите записи")
+            return
+
+        info = self.getColumnInfo(name)
+        if not info:
+            QMessageBox.warning(self, "Ошибка", f"Нет информации о {name}")
+            return
+        table, col = info['table'], info['name']
+
+        try:
+            pk, pk_idx = self.findKeyColumn(table)
+            if pk_idx == -1:
+                QMessageBox.critical(self, "Ошибка", f"Не найден ключ {pk}")
+                return
+
+            typ = self.getColumnType(table, col)
+            processed = None if val == "" else self.convertValue(typ, val)
+            keys = list(dict.fromkeys(self.table.item(r, pk_idx).text() for r in rows))
+
+            cursor = self.connection.cursor()
+            for i in range(0, len(keys), SQL_BATCH_SIZE):
+                chunk = keys[i:i + SQL_BATCH_SIZE]
+                place = ", ".join(["?"] * len(chunk))
+                cursor.execute(f"UPDATE {self.escape(table)} SET {self.escape(col)} = ? "
+                               f"WHERE {self.escape(pk)} IN ({place})", [processed] + chunk)
+            self.connection.commit()
+
+            if processed is None:
+                text = ""
+            elif typ and typ.upper() == 'BOOLEAN':
+                text = "✅ Да" if processed else "❌ Нет"
+            else:
+                text = str(val)
+            c = [self.table.horizontalHeaderItem(i).text() for i in range(self.table.columnCount())].index(name)
+            updated = set(keys)
+            for r in range(self.table.rowCount()):
+                key_item = self.table.item(r, pk_idx)
+                if key_item and key_item.text() in updated:
+                    item = self.table.item(r, c)
+                    if item:
+                        item.setText(text)
+                    else:
+                        self.table.setItem(r, c, QTableWidgetItem(text))
+
+            self.view_stale = True
+            self.updateStatus(f"✅ Обновлено записей: {len(keys)}")
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            QMessageBox.critical(self, "Ошибка", str(e))
+
     def copyCell(self):
         items = self.table.selectedItems()
         if items:
             QApplication.clipboard().setText(items[0].text())
             self.updateStatus("✅ Скопировано")
     
+    def viewInSync(self, reselect=True):
+        """Копирование читает строки запроса вида по их номерам в гриде. После правок
+        прямо в гриде (например, колонки сортировки) номера могли разойтись с запросом -
+        тогда вид перечитывается, а выделение нужно сделать заново."""
+        if not self.view_stale:
+            return True
+        self.displayTableData(*self.view_sort)
+        if reselect:
+            QMessageBox.information(self, "Информация",
+                                    "Таблица обновлена после правок - выделите строки заново")
+            return False
+        return not self.view_stale
+    
     def copyRow(self):
-        items = self.table.selectedItems()
-        if items:
-            r = items[0].row()
-            data = []
-            for c in range(self.table.columnCount()):
-                if self.table.item(r, c):
-                    data.append(self.table.item(r, c).text())
-                elif self.table.cellWidget(r, c):
-                    data.append("[Фото]")
-                else:
-                    data.append("")
-            QApplication.clipboard().setText("\t".join(data))
-            self.updateStatus("✅ Строка скопирована")
+        if not self.viewInSync():
+            return
+        rows = self.selectedRows()
+        if rows:
+            # Один проход запроса от первой выделенной строки до последней, остальные отбрасываются
+            cols = list(range(self.table.columnCount()))
+            buf = StringIO()
+            try:
+                self.writeViewRows(buf, cols, rows[0], rows[-1] - rows[0] + 1, rows=rows)
+            except sqlite3.Error as e:
+                QMessageBox.critical(self, "Ошибка", str(e))
+                return
+            QApplication.clipboard().setText(buf.getvalue())
+            self.updateStatus("✅ Строки скопированы" if len(rows) > 1 else "✅ Строка скопирована")
+    
+    def selectionRange(self):
+        """Охватывающий прямоугольник выделения: (первая строка, число строк, колонки)"""
+        ranges = self.table.selectionModel().selection()
+        if ranges.isEmpty():
+            return 0, 0, []
+        top = min(rg.top() for rg in ranges)
+        bottom = max(rg.bottom() for rg in ranges)
+        cols = set()
+        for rg in ranges:
+            cols.update(range(rg.left(), rg.right() + 1))
+        return top, bottom - top + 1, sorted(cols)
     
+    def formatCopyValue(self, val):
+        if val is None:
+            return ""
+        if isinstance(val, bytes):
+            return "[Фото]" if self.isValidImage(val) else "[BLOB]"
+        return str(val)
+    
+    def writeViewRows(self, out, cols, start, count, fmt="tsv", header=False, rows=None):
+        """Пишет строки текущего представления прямо из запроса, порциями через fetchmany.
+
+        rows - номера строк, если выделение не сплошное: запрос всё равно выполняется один раз."""
+        query, names = self.buildQuery(*self.view_sort)
+        writer = csv.writer(out, delimiter="\t" if fmt == "tsv" else ",", lineterminator="\n")
+        if header:
+            writer.writerow([names[c] for c in cols])
+        
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT * FROM ({query}) LIMIT ? OFFSET ?", (count, start))
+        wanted = set(rows) if rows is not None else None
+        written = 0
+        index = start
+        while True:
+            chunk = cursor.fetchmany(COPY_CHUNK_ROWS)
+            if not chunk:
+                break
+            first, index = index, index + len(chunk)
+            if wanted is not None:
+                chunk = [row for i, row in enumerate(chunk, first) if i in wanted]
+            writer.writerows([self.formatCopyValue(row[c]) for c in cols] for row in chunk)
+            written += len(chunk)
+        return written
+    
+    def copySelection(self, fmt="tsv"):
+        if not self.viewInSync():
+            return
+        start, count, cols = self.selectionRange()
+        if not count:
+            return
+        self.copyBlock(start, count, cols, fmt)
+    
+    def copyTable(self):
+        if not self.viewInSync(reselect=False) or not self.table.columnCount():
+            return
+        self.copyBlock(0, -1, list(range(self.table.columnCount())), "tsv")
+    
+    def copyBlock(self, start, count, cols, fmt):
+        total = self.table.rowCount() - start if count < 0 else count
+        if total * len(cols) > CLIPBOARD_MAX_CELLS:
+            reply = QMessageBox.question(self, "Копирование",
+                                         f"Выделено {total * len(cols)} ячеек - слишком много для буфера.\n"
+                                         "Сохранить в файл?")
+            if reply == QMessageBox.StandardButton.Yes:
+                self.copyToFile(start, count, cols)
+            return
+        
+        try:
+            buf = StringIO()
+            n = self.writeViewRows(buf, cols, start, count, fmt)
+            QApplication.clipboard().setText(buf.getvalue())
+            self.updateStatus(f"✅ Скопировано строк: {n}")
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+    
+    def copyToFile(self, start, count, cols):
+        if not self.viewInSync():
+            return
+        if not cols:
+            QMessageBox.warning(self, "Предупреждение", "Нет выделения")
+            return
+        path, flt = QFileDialog.getSaveFileName(self, "Сохранить выделение", "",
+                                                "TSV files (*.tsv);;CSV files (*.csv)")
+        if not path:
+            return
+        fmt = "csv" if path.lower().endswith(".csv") or "csv" in flt.lower() else "tsv"
+        try:
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                n = self.writeViewRows(f, cols, start, count, fmt, header=True)
+            self.updateStatus(f"✅ Сохранено строк: {n} в {os.path.basename(path)}")
+        except (sqlite3.Error, OSError) as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+    
+    def pasteBlock(self):
+        """Вставка TSV-блока из буфера (Excel) начиная с текущей ячейки"""
+        if not self.current_table:
+            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+            return
+
+        text = QApplication.clipboard().text()
+        # Excel завершает блок переводом строки; пустые строки внутри - пустые ячейки
+        if text.endswith("\r\n"):
+            text = text[:-2]
+        elif text.endswith("\n"):
+            text = text[:-1]
+        block = [row or [""] for row in csv.reader(StringIO(text), delimiter='\t')] if text else []
+        if not block:
+            QMessageBox.warning(self, "Предупреждение", "Буфер обмена пуст")
+            return
+
+        r0 = max(self.table.currentRow(), 0)
+        c0 = max(self.table.currentColumn(), 0)
+        headers = [self.table.horizontalHeaderItem(i).text() for i in range(self.table.columnCount())]
+        if not headers:
+            QMessageBox.warning(self, "Предупреждение", "Нет атрибутов")
+            return
+
+        width = min(max(len(row) for row in block), len(headers) - c0)
+        targets = []  # (индекс в гриде, таблица, колонка, тип)
+        for j in range(width):
+            name = headers[c0 + j]
+            info = self.getColumnInfo(name)
+            if name in self.image_columns or not info:
+                targets.append(None)
+            else:
+                targets.append((c0 + j, info['table'], info['name'],
+                                self.getColumnType(info['table'], info['name'])))
+
+        n_update = min(len(block), self.table.rowCount() - r0)
+        updates = {}  # (таблица, колонка, тип) -> [(значение, ключ)]
+        cells = []    # (строка, колонка, значение) для обновления грида
+        inserts = []
+
+        try:
+            keys = {}
+            for t in {tg[1] for tg in targets if tg}:
+                keys[t] = self.findKeyColumn(t)
+                if keys[t][1] == -1:
+                    QMessageBox.critical(self, "Ошибка", f"Не найден ключ {keys[t][0]}")
+                    return
+            # Построчная замена ключей (1→2, 2→3) затирала бы соседние записи
+            if n_update and any(tg and tg[2] == keys[tg[1]][0] for tg in targets):
+                QMessageBox.warning(self, "Предупреждение",
+                                    "Вставка в ключевую колонку существующих записей не поддерживается")
+                return
+
+            for i in range(n_update):
+                row = block[i]
+                for j, tg in enumerate(targets):
+                    if not tg or j >= len(row):
+                        continue
+                    c, t, col, typ = tg
+                    key = self.table.item(r0 + i, keys[t][1]).text()
+                    val = None if row[j] == "" else self.convertValue(typ, row[j])
+                    updates.setdefault((t, col, typ), []).append((val, key))
+                    cells.append((r0 + i, c, val, typ))
+
+            # Строки за последней строкой грида - новые записи основной таблицы
+            ins_cols = [tg for tg in targets if tg and tg[1] == self.current_table]
+            for row in block[n_update:]:
+                vals = []
+                for j, tg in enumerate(targets):
+                    if tg and tg[1] == self.current_table:
+                        v = row[j] if j < len(row) else ""
+                        vals.append(None if v == "" else self.convertValue(tg[3], v))
+                inserts.append(vals)
+
+            cursor = self.connection.cursor()
+            for t, col, typ in updates:
+                pk = keys[t][0]
+                cursor.executemany(f"UPDATE {self.escape(t)} SET {self.escape(col)} = ? "
+                                   f"WHERE {self.escape(pk)} = ?", updates[(t, col, typ)])
+            if inserts and ins_cols:
+                names = ", ".join(self.escape(tg[2]) for tg in ins_cols)
+                place = ", ".join(["?"] * len(ins_cols))
+                cursor.executemany(f"INSERT INTO {self.escape(self.current_table)} ({names}) "
+                                   f"VALUES ({place})", inserts)
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+
+        if inserts and ins_cols:
+            self.displayTableData()
+        else:
+            self.table.setUpdatesEnabled(False)
+            for r, c, val, typ in cells:
+                if val is None:
+                    text = ""
+                elif typ and typ.upper() == 'BOOLEAN':
+                    text = "✅ Да" if val else "❌ Нет"
+                else:
+                    text = str(val)
+                item = self.table.item(r, c)
+                if item:
+                    item.setText(text)
+                else:
+                    self.table.setItem(r, c, QTableWidgetItem(text))
+            self.table.setUpdatesEnabled(True)
+            self.view_stale = True
+
+        self.updateStatus(f"✅ Вставлено: {len(cells)} ячеек, {len(inserts) if ins_cols else 0} записей")
+
     def copyHeader(self):
         items = self.table.selectedItems()
         if items:
@@ -1530,36 +3247,235 @@ class ModernDatabaseApp(QMainWindow):
             QMessageBox.critical(self, "Ошибка", str(e))
     
     def renameColumn(self, old, new):
+        table = self.current_table
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({self.escape(self.current_table)})")
-            cols = cursor.fetchall()
-            
-            new_cols = []
-            for col in cols:
-                if col[1] == old:
-                    new_cols.append(f'"{new}" {col[2]}')
-                else:
-                    new_cols.append(f'"{col[1]}" {col[2]}')
-            
-            temp = f"temp_{self.current_table}"
-            
-            cursor.execute(f"CREATE TABLE {self.escape(temp)} ({', '.join(new_cols)})")
-            
-            col_names = [f'"{c[1]}"' for c in cols]
-            col_list = ', '.join(col_names)
-            
-            insert_query = f"INSERT INTO {self.escape(temp)} SELECT {col_list} FROM {self.escape(self.current_table)}"
-            cursor.execute(insert_query)
-            
-            cursor.execute(f"DROP TABLE {self.escape(self.current_table)}")
-            cursor.execute(f"ALTER TABLE {self.escape(temp)} RENAME TO {self.escape(self.current_table)}")
-            
-            self.connection.commit()
-            self.displayTableData()
-            self.updateStatus(f"✅ {old} -> {new}")
+            if sqlite3.sqlite_version_info >= (3, 25, 0):
+                # Меняется только схема, данные не переписываются
+                self.connection.execute(f"ALTER TABLE {self.escape(table)} "
+                                        f"RENAME COLUMN {self.escape(old)} TO {self.escape(new)}")
+                self.connection.commit()
+            else:
+                self.rebuildTableWithRename(table, old, new)
         except sqlite3.Error as e:
+            self.connection.rollback()
             QMessageBox.critical(self, "Ошибка", str(e))
+            return
+
+        # Выбранные атрибуты и условия соединений ссылаются на старое имя
+        self.selected_attributes = [f"{table}.{new}" if a == f"{table}.{old}" else a
+                                    for a in self.selected_attributes]
+        old_sql = f"{self.escape(table)}.{self.escape(old)}"
+        new_sql = f"{self.escape(table)}.{self.escape(new)}"
+        for base, joins in [(table, self.joined_tables)] + list(self.table_joins.items()):
+            for j in joins:
+                j['condition'] = j['condition'].replace(old_sql, new_sql)
+                if 'columns' in j:
+                    # По columns строятся советы по индексам и оценка размера соединения
+                    a1, a2 = j['columns']
+                    j['columns'] = (new if base == table and a1 == old else a1,
+                                    new if j['table2'] == table and a2 == old else a2)
+        self.table_joins[table] = self.joined_tables.copy()
+        self.updateJoinInfo()
+        self.updateAttributesLabel()
+
+        self.displayTableData()
+        self.updateStatus(f"✅ {old} -> {new}")
+
+    def renameIdentifier(self, sql, old, new, table=None):
+        """Заменяет имя колонки old на new в CREATE TABLE (тело со скобки), INDEX или TRIGGER.
+
+        Разбор учитывает кавычки и комментарии. Заменяются только определение
+        колонки и ссылки на неё; ключевые слова и типы (PRIMARY KEY при колонке
+        key, TEXT при колонке text) и колонки чужих таблиц в REFERENCES не трогаются."""
+        token = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|`[^`]*`|--[^\n]*|/\*.*?(?:\*/|$)"
+                           r"|[^\W\d][\w$]*|\d[\w.]*|\s+|.", re.S)
+        tokens = token.findall(sql)
+        sig = [i for i, t in enumerate(tokens) if not t.isspace() and not t.startswith(("--", "/*"))]
+        
+        def ident(k):
+            """Имя идентификатора в позиции k (без кавычек) или None"""
+            if not 0 <= k < len(sig):
+                return None
+            t = tokens[sig[k]]
+            if t[0] == '"':
+                return t[1:-1].replace('""', '"')
+            if t[0] in "[`":
+                return t[1:-1]
+            return t if t[0].isalpha() or t[0] == "_" else None
+        
+        def word(k):
+            """Ключевое слово или знак в позиции k; для имён в кавычках - пусто"""
+            if not 0 <= k < len(sig) or tokens[sig[k]][0] in '"[`\'':
+                return ""
+            return tokens[sig[k]].upper()
+        
+        def isReference(k):
+            name = ident(k)
+            if name is None or name.lower() != old.lower():
+                return False
+            prev, prev2, nxt = word(k - 1), word(k - 2), word(k + 1)
+            if nxt in ("(", "."):
+                return False  # вызов функции или имя таблицы перед точкой
+            if prev == ".":
+                owner = (ident(k - 2) or "").lower()
+                return owner in ("new", "old") or bool(table) and owner == table.lower()
+            if prev in ("PRIMARY", "FOREIGN", "COLLATE", "AS", "CONFLICT", "NO", "INITIALLY", "WITHOUT",
+                        "CONSTRAINT", "INDEX", "TABLE", "TRIGGER", "EXISTS", "REFERENCES", "INTO",
+                        "FROM", "JOIN", "UPDATE", "DELETE"):
+                return False
+            if prev == "OR" and prev2 in ("INSERT", "UPDATE") or prev == "(" and prev2 == "RAISE":
+                return False
+            if word(k) in ("ASC", "DESC", "STORED", "VIRTUAL", "AUTOINCREMENT") and prev not in ("(", ","):
+                return False
+            return True
+        
+        rename = set()
+        skip = set()  # колонки чужой таблицы в REFERENCES t(...)
+        for k in range(len(sig)):
+            if word(k) == "REFERENCES" and (ident(k + 1) or "").lower() != (table or "").lower() \
+                    and word(k + 2) == "(":
+                depth, j = 0, k + 2
+                while j < len(sig):
+                    depth += {"(": 1, ")": -1}.get(word(j), 0)
+                    skip.add(j)
+                    if depth == 0:
+                        break
+                    j += 1
+        
+        if word(0) == "(":
+            # Тело CREATE TABLE: элементы верхнего уровня - определения колонок и ограничения таблицы
+            depth, start = 0, True
+            k = 0
+            while k < len(sig):
+                w = word(k)
+                if depth == 1 and start and w not in ("CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN"):
+                    # Имя колонки, затем слова типа (и его размер в скобках) - до первого ограничения
+                    if ident(k) is not None and ident(k).lower() == old.lower():
+                        rename.add(k)
+                    k += 1
+                    while ident(k) is not None and word(k) not in (
+                            "CONSTRAINT", "PRIMARY", "NOT", "NULL", "UNIQUE", "CHECK", "DEFAULT",
+                            "COLLATE", "REFERENCES", "GENERATED", "AS"):
+                        k += 1
+                    if word(k) == "(":
+                        while k < len(sig) and word(k) != ")":
+                            k += 1
+                        k += 1
+                    start = False
+                    continue
+                start = False
+                if w == "(":
+                    depth += 1
+                    start = depth == 1
+                elif w == ")":
+                    depth -= 1
+                    if depth == 0:
+                        break  # дальше WITHOUT ROWID / STRICT
+                elif w == "," and depth == 1:
+                    start = True
+                elif depth >= 1 and k not in skip and isReference(k):
+                    rename.add(k)
+                k += 1
+        elif any(word(k) == "TRIGGER" for k in range(3)) and "BEGIN" in map(word, range(len(sig))):
+            # Заголовок триггера (UPDATE OF ... ON, WHEN NEW.x) относится к его таблице. В теле имя
+            # без NEW./OLD./<таблица>. меняется только в командах над этой таблицей: в
+            # UPDATE log SET key = NEW.key колонка key - чужая
+            def target(k):
+                w, j = word(k), k + 1
+                if w not in ("INSERT", "REPLACE", "UPDATE", "DELETE"):
+                    return None
+                if word(j) == "OR":
+                    j += 2
+                if word(j) in ("INTO", "FROM"):
+                    j += 1
+                return ident(j + 2) if word(j + 1) == "." else ident(j)
+            
+            begin = next(k for k in range(len(sig)) if word(k) == "BEGIN")
+            for k in range(begin):
+                if k not in skip and word(k - 1) != "ON" and isReference(k):
+                    rename.add(k)
+            # Внутри SELECT (INSERT ... SELECT, подзапросы) имена относятся к его FROM
+            depth, own, select = 0, False, None
+            for k in range(begin + 1, len(sig)):
+                w = word(k)
+                if depth == 0 and (k == begin + 1 or word(k - 1) == ";"):
+                    own, select = (target(k) or "").lower() == (table or "").lower(), None
+                depth += {"(": 1, ")": -1}.get(w, 0)
+                if select is not None and depth < select:
+                    select = None
+                if w == "SELECT" and select is None:
+                    select = depth
+                if k in skip or not isReference(k):
+                    continue
+                if own and select is None or word(k - 1) == ".":
+                    rename.add(k)
+        else:
+            rename = {k for k in range(len(sig)) if k not in skip and isReference(k)}
+        
+        for k in rename:
+            tokens[sig[k]] = self.escape(new)
+        return "".join(tokens)
+
+    def rebuildTableWithRename(self, table, old, new):
+        """Переименование колонки пересборкой таблицы для SQLite < 3.25.
+
+        Схема, индексы и триггеры берутся из sqlite_master и пересоздаются
+        с новым именем, данные копируются порциями в одной транзакции."""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (table,))
+        objects = cursor.fetchall()
+        create = next(sql for typ, sql in objects if typ == 'table')
+        extras = [self.renameIdentifier(sql, old, new, table) for typ, sql in objects if typ in ('index', 'trigger')]
+
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        cols = [c[1] for c in cursor.fetchall()]
+        src = ", ".join(self.escape(c) for c in cols)
+        dst = ", ".join(self.escape(new if c == old else c) for c in cols)
+
+        temp = f"temp_{table}"
+        body = self.renameIdentifier(create[create.index('('):], old, new, table)
+        without_rowid = not self.hasRowid(table)
+
+        self.connection.commit()
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        try:
+            cursor.execute("BEGIN")
+            cursor.execute(f"CREATE TABLE {self.escape(temp)} {body}")
+
+            if without_rowid:
+                cursor.execute(f"INSERT INTO {self.escape(temp)} ({dst}) SELECT {src} FROM {self.escape(table)}")
+            else:
+                progress = self.createProgress(f"Перенос данных {table}...", 100)
+                try:
+                    for where, params, pct in self.rowidChunks(cursor, table):
+                        cursor.execute(f"INSERT INTO {self.escape(temp)} (rowid, {dst}) "
+                                       f"SELECT rowid, {src} FROM {self.escape(table)} WHERE {where}", params)
+                        progress.setValue(pct)
+                        QApplication.processEvents()
+                finally:
+                    progress.close()
+
+            cursor.execute(f"DROP TABLE {self.escape(table)}")
+            cursor.execute(f"ALTER TABLE {self.escape(temp)} RENAME TO {self.escape(table)}")
+            for sql in extras:
+                cursor.execute(sql)
+            if cursor.execute("PRAGMA foreign_key_check").fetchone():
+                raise sqlite3.IntegrityError("Нарушены внешние ключи после пересборки")
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.execute("PRAGMA foreign_keys = ON")
+
+    def createProgress(self, text, maximum):
+        """Модальный индикатор для долгих операций"""
+        progress = QProgressDialog(text, None, 0, maximum, self)
+        progress.setWindowTitle("Выполнение")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(500)
+        progress.setValue(0)
+        return progress
     
     def addColumn(self):
         if not self.current_table:
@@ -1569,29 +3485,81 @@ class ModernDatabaseApp(QMainWindow):
         dlg = AddColumnDialog(self, self.current_table)
         if dlg.exec():
             name, typ, default = dlg.getData()
-            self.addColumnToTable(name, typ, default)
+            self.addColumnToTable(name, typ, default, dlg.getFillValue())
     
-    def addColumnToTable(self, name, typ, default=None):
+    def sqlLiteral(self, val):
+        if val is None:
+            return "NULL"
+        if isinstance(val, (int, float)):
+            return repr(val)
+        return "'" + str(val).replace("'", "''") + "'"
+
+    def planAddColumn(self, name, typ, default=None, fill=None):
+        """План добавления колонки.
+
+        DEFAULT-константа хранится в схеме и отдаётся для старых строк без
+        перезаписи таблицы. Заполнение (backfill) нужно, только если старые
+        строки должны получить значение, отличное от DEFAULT."""
+        default = None if default is None else self.convertValue(typ, default)
+        fill = None if fill is None else self.convertValue(typ, fill)
+
+        ddl = f"ALTER TABLE {self.escape(self.current_table)} ADD COLUMN {self.escape(name)} {typ}"
+        if default is not None:
+            ddl += f" DEFAULT {self.sqlLiteral(default)}"
+        return {'ddl': ddl, 'backfill': fill is not None and fill != default, 'value': fill}
+
+    def addColumnToTable(self, name, typ, default=None, fill=None):
+        table = self.current_table
+        plan = self.planAddColumn(name, typ, default, fill)
         try:
             cursor = self.connection.cursor()
-            query = f"ALTER TABLE {self.escape(self.current_table)} ADD COLUMN {self.escape(name)} {typ}"
-            
-            if default is not None:
-                if typ.upper() == 'BOOLEAN':
-                    default = '1' if default.lower() in ['true', '1', 'да'] else '0'
-                query += f" DEFAULT {default}"
-            
-            cursor.execute(query)
             self.connection.commit()
-            
-            if default is not None:
-                cursor.execute(f"UPDATE {self.escape(self.current_table)} SET {self.escape(name)} = ?", (default,))
-                self.connection.commit()
-            
+            cursor.execute("BEGIN")
+            cursor.execute(plan['ddl'])
+
+            if plan['backfill']:
+                update = f"UPDATE {self.escape(table)} SET {self.escape(name)} = ?"
+                if not self.hasRowid(table):
+                    cursor.execute(update, (plan['value'],))
+                else:
+                    progress = self.createProgress(f"Заполнение {name}...", 100)
+                    try:
+                        for where, params, pct in self.rowidChunks(cursor, table):
+                            cursor.execute(f"{update} WHERE {where}", (plan['value'], *params))
+                            progress.setValue(pct)
+                            QApplication.processEvents()
+                    finally:
+                        progress.close()
+
+            self.connection.commit()
             self.updateStatus(f"✅ Колонка {name} добавлена")
             self.displayTableData()
         except sqlite3.Error as e:
+            self.connection.rollback()
             QMessageBox.critical(self, "Ошибка", str(e))
+
+    def rowidChunks(self, cursor, table):
+        """Порции таблицы по TABLE_CHUNK_ROWS строк: (условие WHERE, параметры, процент).
+
+        Границы ищутся по самим строкам (ключевой обход), а не по диапазону
+        rowid - разреженные ключи вроде отметок времени не дают пустых шагов."""
+        total = cursor.execute(f"SELECT COUNT(*) FROM {self.escape(table)}").fetchone()[0] or 1
+        lower, params, done = "1", (), 0
+        while True:
+            end = cursor.execute(f"SELECT rowid FROM {self.escape(table)} WHERE {lower} ORDER BY rowid "
+                                 f"LIMIT 1 OFFSET {TABLE_CHUNK_ROWS - 1}", params).fetchone()
+            if end is None:
+                yield lower, params, 100
+                return
+            done += TABLE_CHUNK_ROWS
+            yield f"{lower} AND rowid <= ?", (*params, end[0]), min(100, done * 100 // total)
+            lower, params = "rowid > ?", (end[0],)
+    
+    def hasRowid(self, table):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        row = cursor.fetchone()
+        return not (row and row[0] and re.search(r"WITHOUT\s+ROWID\s*$", row[0], re.IGNORECASE))
     
     def createTable(self):
         dlg = CreateTableDialog(self)
@@ -1693,12 +3661,13 @@ class ModernDatabaseApp(QMainWindow):
         
         dlg = MultiTableSelectDialog(self, tables)
         if dlg.exec():
-            for t in dlg.getSelectedTables():
-                common = self.findCommonColumns(self.current_table, t)
-                if not common:
-                    QMessageBox.warning(self, "Предупреждение", f"Нет общих полей с {t}")
-                    continue
-                self.joinTables(t, common[0], common[0])
+            with self.estimateMemo():
+                for t in dlg.getSelectedTables():
+                    pairs = self.findJoinColumns(self.current_table, t)
+                    if not pairs:
+                        QMessageBox.warning(self, "Предупреждение", f"Нет общих полей с {t}")
+                        continue
+                    self.joinTables(t, *pairs[0])
     
     def findCommonColumns(self, t1, t2):
         try:
@@ -1711,6 +3680,174 @@ class ModernDatabaseApp(QMainWindow):
         except:
             return []
     
+    def findJoinColumns(self, t1, t2):
+        """Пары (колонка t1, колонка t2) для соединения, лучшие первыми.
+
+        Объявленные внешние ключи идут раньше совпадений по имени, а совпадения
+        по имени упорядочены по оценке размера результата."""
+        pairs = []
+        try:
+            cursor = self.connection.cursor()
+            for src, dst, flip in ((t1, t2, False), (t2, t1, True)):
+                cursor.execute(f"PRAGMA foreign_key_list({self.escape(src)})")
+                for fk in cursor.fetchall():
+                    if fk[2] != dst:
+                        continue
+                    to = fk[4] or self.findKeyColumnName(dst)
+                    pair = (to, fk[3]) if flip else (fk[3], to)
+                    if pair not in pairs:
+                        pairs.append(pair)
+        except sqlite3.Error:
+            pass
+        
+        common = [(c, c) for c in self.findCommonColumns(t1, t2) if (c, c) not in pairs]
+        with self.estimateMemo():
+            common.sort(key=lambda p: self.estimateJoinRows(t1, p[0], t2, p[1]))
+        return pairs + common
+    
+    @contextmanager
+    def estimateMemo(self):
+        """Запоминает countRows/countDistinct на время одного действия: оценки
+        для нескольких кандидатов и уже соединённых таблиц не пересчитываются"""
+        outer = self.estimate_memo is None
+        if outer:
+            self.estimate_memo = {}
+        try:
+            yield
+        finally:
+            if outer:
+                self.estimate_memo = None
+    
+    def findKeyColumnName(self, table):
+        """Первичный ключ таблицы, а если его нет - первая колонка"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        info = cursor.fetchall()
+        pk = [c[1] for c in sorted(info, key=lambda c: c[5]) if c[5]]
+        return pk[0] if pk else info[0][1]
+    
+    def tableStat(self, table, index=None):
+        """Числа из sqlite_stat1 для индекса (или всей таблицы), None если ANALYZE не было"""
+        try:
+            cursor = self.connection.cursor()
+            if index is None:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,))
+            else:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? AND idx = ?", (table, index))
+            row = cursor.fetchone()
+        except sqlite3.Error:
+            return None
+        if not row or not row[0]:
+            return None
+        return [int(x) for x in row[0].split() if x.isdigit()]
+    
+    def countRows(self, table):
+        """Число строк для оценок: подсчитанное или sqlite_stat1; без них - COUNT(*),
+        который для небольших таблиц останавливается на выборке из JOIN_SAMPLE_ROWS строк"""
+        memo = self.estimate_memo if self.estimate_memo is not None else {}
+        if ('rows', table) not in memo:
+            count, _ = self.estimateCount(table)
+            if count is None:
+                count = self.connection.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {self.escape(table)} "
+                                                f"LIMIT {JOIN_SAMPLE_ROWS})").fetchone()[0]
+                if count >= JOIN_SAMPLE_ROWS:
+                    count = self.connection.execute(f"SELECT COUNT(*) FROM {self.escape(table)}").fetchone()[0]
+            memo[('rows', table)] = count
+        return memo[('rows', table)]
+    
+    def countDistinct(self, table, col, rows):
+        """Оценка числа различных значений колонки.
+
+        Сначала sqlite_stat1 по индексу, начинающемуся с колонки, иначе
+        COUNT(DISTINCT) по выборке из JOIN_SAMPLE_ROWS строк."""
+        memo = self.estimate_memo if self.estimate_memo is not None else {}
+        if ('distinct', table, col) not in memo:
+            memo[('distinct', table, col)] = self.sampleDistinct(table, col, rows)
+        return memo[('distinct', table, col)]
+    
+    def sampleDistinct(self, table, col, rows):
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA index_list({self.escape(table)})")
+        for idx in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_info({self.escape(idx[1])})")
+            info = cursor.fetchall()
+            if info and info[0][2] == col:
+                stat = self.tableStat(table, idx[1])
+                if stat and len(stat) > 1 and stat[1]:
+                    return max(1, stat[0] // stat[1])
+        
+        if self.isRowidAlias(table, col):
+            return max(1, rows)
+        
+        cursor.execute(f"SELECT COUNT(*), COUNT(DISTINCT v) FROM "
+                       f"(SELECT {self.escape(col)} AS v FROM {self.escape(table)} LIMIT {JOIN_SAMPLE_ROWS})")
+        sample, distinct = cursor.fetchone()
+        if sample < JOIN_SAMPLE_ROWS:
+            return max(1, distinct)
+        if distinct * 10 < sample:
+            return max(1, distinct)  # Мало значений - выборка уже их все покрыла
+        return max(1, distinct * rows // sample)
+    
+    def isRowidAlias(self, table, col):
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        info = cursor.fetchall()
+        pk = [c for c in info if c[5]]
+        return len(pk) == 1 and pk[0][1] == col and pk[0][2].upper() == "INTEGER"
+    
+    def estimateJoinRows(self, t1, a1, t2, a2, typ="INNER"):
+        """Оценка строк t1 JOIN t2: |t1| * |t2| / max(distinct(a1), distinct(a2))"""
+        try:
+            r1, r2 = self.countRows(t1), self.countRows(t2)
+            d = max(self.countDistinct(t1, a1, r1), self.countDistinct(t2, a2, r2))
+        except sqlite3.Error:
+            return 0
+        est = r1 * r2 // d
+        return max(est, r1) if typ.startswith("LEFT") else est
+    
+    def estimateViewRows(self, t2, a1, a2, typ="INNER"):
+        """Оценка строк текущего вида после добавления соединения с t2"""
+        est = self.estimateJoinRows(self.current_table, a1, t2, a2, typ)
+        try:
+            base = self.countRows(self.current_table)
+        except sqlite3.Error:
+            return est
+        for j in self.joined_tables:
+            if 'columns' not in j:
+                continue
+            part = self.estimateJoinRows(self.current_table, j['columns'][0], j['table2'], j['columns'][1],
+                                         j.get('join_type', 'INNER'))
+            if base:
+                est = est * part // base
+        return est
+    
+    def confirmJoinSize(self, t2, a1, a2, typ):
+        """Спрашивает, что делать с большим соединением.
+
+        Возвращает (продолжать, LIMIT или None)."""
+        with self.estimateMemo():
+            est = self.estimateViewRows(t2, a1, a2, typ)
+        if est <= JOIN_ROWS_WARN:
+            return True, None
+        
+        box = QMessageBox(self)
+        box.setIcon(QMessageBox.Icon.Warning)
+        box.setWindowTitle("Большое соединение")
+        box.setText(f"{self.current_table}.{a1} = {t2}.{a2}\n"
+                    f"Ожидается около {est:,} строк - соединение по неключевым полям "
+                    "может не поместиться в память.")
+        limit_btn = box.addButton(f"Ограничить {JOIN_ROWS_WARN:,}", QMessageBox.ButtonRole.AcceptRole)
+        all_btn = box.addButton("Показать всё", QMessageBox.ButtonRole.DestructiveRole)
+        box.addButton(QMessageBox.StandardButton.Cancel)
+        box.setDefaultButton(limit_btn)
+        box.exec()
+        
+        if box.clickedButton() == limit_btn:
+            return True, JOIN_ROWS_WARN
+        if box.clickedButton() == all_btn:
+            return True, None
+        return False, None
+    
     def joinTables(self, t2, a1, a2, typ="INNER"):
         try:
             cursor = self.connection.cursor()
@@ -1729,8 +3866,13 @@ class ModernDatabaseApp(QMainWindow):
                     QMessageBox.warning(self, "Предупреждение", f"{t2} уже соединена")
                     return False
             
+            ok, limit = self.confirmJoinSize(t2, a1, a2, typ)
+            if not ok:
+                return False
+            
             cond = f"{self.escape(self.current_table)}.{self.escape(a1)} = {self.escape(t2)}.{self.escape(a2)}"
-            self.joined_tables.append({'table2': t2, 'condition': cond, 'join_type': typ})
+            self.joined_tables.append({'table2': t2, 'condition': cond, 'join_type': typ,
+                                       'columns': (a1, a2), 'limit': limit})
             self.table_joins[self.current_table] = self.joined_tables.copy()
             
             self.updateJoinInfo()
@@ -1741,113 +3883,1082 @@ class ModernDatabaseApp(QMainWindow):
             QMessageBox.critical(self, "Ошибка", str(e))
             return False
     
-    def joinTablesAdvanced(self):
-        if not self.current_table:
-            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+    def joinTablesAdvanced(self):
+        if not self.current_table:
+            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+            return
+        
+        dlg = JoinTablesDialog(self, self.current_table, self.connection)
+        if dlg.exec():
+            t2, a1, a2, typ = dlg.getData()
+            self.joinTables(t2, a1, a2, typ)
+    
+    def selectAttributes(self):
+        if not self.current_table and not self.joined_tables:
+            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+            return
+        
+        dlg = SelectAttributesDialog(self, self.getAllColumns(), self.selected_attributes)
+        if dlg.exec():
+            self.selected_attributes = dlg.getSelectedAttributes()
+            self.updateAttributesLabel()
+            self.displayTableData()
+    
+    def inspectDB(self):
+        if not self.connection:
+            QMessageBox.warning(self, "Предупреждение", "Нет подключения")
+            return
+        
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+            tables = [t[0] for t in cursor.fetchall()]
+            columns = {}
+            for name in tables:
+                cursor.execute(f"PRAGMA table_info({self.escape(name)})")
+                columns[name] = [(c[1], c[2]) for c in cursor.fetchall()]
+            estimates = {name: self.estimateCount(name, bound=True) for name in tables}
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        
+        # Отчёт показывается сразу по оценкам, точные COUNT(*) приходят из пула по мере готовности
+        pending = set(tables)
+        # Версия данных на начало подсчёта: запись во время него делает результат устаревшим
+        version = self.dataVersion()
+        edit = self.showTextDialog("Исследование", self.buildInspectReport(tables, columns, estimates, pending),
+                                   modal=False)
+        
+        def on_count(count, name):
+            self.row_counts[name] = (count, datetime.now(), version)
+            estimates[name] = (count, "")
+            pending.discard(name)
+            if edit.isVisible():
+                edit.setPlainText(self.buildInspectReport(tables, columns, estimates, pending))
+        
+        self.updateStatus("🔍 Подсчёт строк...")
+        self.runInBackground(lambda conn, progress: self.countAllRows(conn, progress, tables),
+                             lambda _: self.updateStatus("✅ Строки подсчитаны"), on_count)
+    
+    def estimateCount(self, table, bound=False):
+        """Быстрая оценка строк без полного сканирования: (число, источник) или (None, '').
+
+        bound - для отчёта: без статистики вернуть MAX(rowid) как верхнюю границу.
+        Для оценок JOIN она не годится: rowid бывают разреженными (время, snowflake)."""
+        if table in self.row_counts:
+            count, when, version = self.row_counts[table]
+            if version == self.dataVersion():
+                return count, f"подсчитано {when:%H:%M:%S}"
+            del self.row_counts[table]  # С подсчёта в базу писали
+        stat = self.tableStat(table)
+        if stat:
+            return stat[0], "sqlite_stat1"
+        if not bound:
+            return None, ""
+        try:
+            # MAX(rowid) читает одну страницу B-дерева; при удалениях это верхняя граница
+            row = self.connection.execute(f"SELECT MAX(rowid) FROM {self.escape(table)}").fetchone()
+            return (row[0] or 0), "≤, по MAX(rowid)"
+        except sqlite3.Error:
+            return None, ""  # WITHOUT ROWID
+    
+    def countAllRows(self, conn, progress, tables):
+        cursor = conn.cursor()
+        for name in tables:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.escape(name)}")
+            progress(cursor.fetchone()[0], name)
+    
+    def buildInspectReport(self, tables, columns, estimates, pending):
+        text = "🔍 ИССЛЕДОВАНИЕ\n" + "="*50 + "\n\n"
+        text += f"📁 {os.path.basename(self.db_name)}\n"
+        text += f"📋 Таблиц: {len(tables)}"
+        text += f" | ⏳ подсчёт строк: осталось {len(pending)}\n\n" if pending else "\n\n"
+        
+        for name in tables:
+            text += f"📊 {name}\n" + "-"*30 + "\n"
+            for col, typ in columns[name]:
+                text += f"  - {col} ({typ})\n"
+            
+            if name not in pending:
+                text += f"📈 Записей: {estimates[name][0]:,}\n"
+            else:
+                count, source = estimates[name]
+                text += f"📈 Записей: ~{count:,} ({source}) ⏳\n" if count is not None else "📈 Записей: ⏳\n"
+            text += "\n"
+        
+        return text
+    
+    def showPhotoMenu(self):
+        if not self.connection:
+            QMessageBox.warning(self, "Предупреждение", "Нет подключения")
+            return
+        menu = QMenu()
+        menu.setFont(QFont("Arial", 10))
+        items = [
+            ("🗂 Галерея колонки", self.openGallery),
+            ("📂 Импорт фото из папки", self.importPhotoFolder),
+            ("📤 Выгрузить все фото", self.findAllPhotos),
+            ("♻️ Пережать фото в колонке", self.transcodeColumn),
+            ("🧬 Убрать повторы фото", self.deduplicatePhotos),
+            ("📁 Хранить фото в файлах", self.externalizePhotos),
+            ("🔍 Найти похожие фото", self.findSimilarPhotos),
+            ("🧹 Удалить файлы фото без ссылок", self.cleanPhotoFiles),
+        ]
+        actions = {menu.addAction(text): callback for text, callback in items}
+        action = menu.exec(QCursor.pos())
+        if action in actions:
+            actions[action]()
+    
+    def openGallery(self, name=None):
+        """Галерея колонки фото; без имени колонка выбирается из текущей таблицы"""
+        if not self.current_table:
+            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+            return
+        try:
+            if name:
+                info = self.column_mapping.get(name, {'table': self.current_table, 'name': name})
+                table, col = info['table'], info['name']
+            else:
+                table = self.current_table
+                cols = [c for c in self.photoColumns(self.connection.cursor(), table)
+                        if not c.endswith(PHOTO_THUMB_SUFFIX)]
+                if not cols:
+                    QMessageBox.warning(self, "Предупреждение", "В таблице нет колонок с фото")
+                    return
+                col, ok = QInputDialog.getItem(self, "Галерея", "Колонка:", cols, 0, False)
+                if not ok:
+                    return
+            # Готовая колонка миниатюр читается вместо полного фото
+            thumb = self.thumbColumn(table, col)
+            pk = self.findKeyColumnName(table)
+            keys = self.connection.execute(f"SELECT rowid, {self.escape(pk)} FROM {self.escape(table)} "
+                                           f"WHERE {self.escape(col)} IS NOT NULL ORDER BY rowid").fetchall()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        PhotoGalleryDialog(self, table, col, keys, thumb).exec()
+    
+    def matchPhotoFiles(self, folder, pattern, recursive, keys):
+        """Сопоставляет файлы папки ключам записей по шаблону имени.
+
+        Возвращает (совпадения [(ключ, путь)], файлы без записи, повторы ключа)."""
+        files = Path(folder).rglob("*") if recursive else Path(folder).iterdir()
+        matches, unmatched, duplicates = {}, [], []
+        for path in sorted(files):
+            if not path.is_file() or path.suffix.lower() not in PHOTO_EXTENSIONS:
+                continue
+            m = pattern.match(path.stem)
+            key = (m.group("key") if "key" in pattern.groupindex else m.group(0)) if m else None
+            if key not in keys:
+                unmatched.append(path)
+            elif key in matches:
+                duplicates.append(path)
+            else:
+                matches[key] = str(path)
+        return [(keys[k], p) for k, p in matches.items()], unmatched, duplicates
+    
+    def importPhotoFolder(self):
+        """Массовая загрузка фото из папки: имя файла -> ключ записи"""
+        if not self.current_table:
+            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+            return
+        table = self.current_table
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA table_info({self.escape(table)})")
+        columns = [c[1] for c in cursor.fetchall()]
+        
+        dlg = BulkPhotoImportDialog(self, table, columns, [c for c in columns if self.isImageColumn(c)])
+        if not dlg.exec():
+            return
+        folder, key_col, photo_col, pattern, recursive, dry_run = dlg.getData()
+        if not folder or not os.path.isdir(folder):
+            QMessageBox.warning(self, "Предупреждение", "Выберите папку")
+            return
+        try:
+            pattern = re.compile(pattern)
+        except re.error as e:
+            QMessageBox.critical(self, "Ошибка", f"Неверный шаблон: {e}")
+            return
+        
+        try:
+            cursor.execute(f"SELECT {self.escape(key_col)} FROM {self.escape(table)}")
+            keys = {str(k[0]): k[0] for k in cursor.fetchall() if k[0] is not None}
+            matches, unmatched, duplicates = self.matchPhotoFiles(folder, pattern, recursive, keys)
+        except (sqlite3.Error, OSError) as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        
+        report = "📂 ИМПОРТ ФОТО\n" + "="*50 + "\n\n"
+        report += f"📁 {folder}\n📋 {table}.{photo_col} по {key_col}\n\n"
+        report += f"✅ Совпало: {len(matches)}\n❌ Без записи: {len(unmatched)}\n⚠ Повтор ключа: {len(duplicates)}\n\n"
+        for title, paths in (("Без записи", unmatched), ("Повтор ключа (пропущены)", duplicates)):
+            if paths:
+                report += f"{title}:\n" + "".join(f"  {p.name}\n" for p in paths) + "\n"
+        if dry_run:
+            self.showTextDialog("Импорт фото - проверка", report)
+            return
+        if not matches:
+            QMessageBox.information(self, "Информация", "Нет файлов, совпавших с ключами")
+            return
+        if QMessageBox.question(self, "Импорт фото",
+                                f"Загрузить {len(matches)} фото в {table}.{photo_col}?\n"
+                                f"Без записи: {len(unmatched)}, повторов: {len(duplicates)}"
+                                ) != QMessageBox.StandardButton.Yes:
+            return
+        
+        settings = dict(self.photo_settings)
+        try:
+            thumb_col = self.thumbColumn(table, photo_col, create=settings["thumbnail"])
+            self.connection.commit()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        sets = f"{self.escape(photo_col)} = ?" + (f", {self.escape(thumb_col)} = ?" if thumb_col else "")
+        sql = f"UPDATE {self.escape(table)} SET {sets} WHERE {self.escape(key_col)} = ?"
+        key_of = {path: key for key, path in matches}
+        paths = list(key_of)
+        store = self.photo_store if self.photo_store.enabled() else None
+        progress = self.createBackgroundProgress("📂 Импорт фото...")
+        
+        def run(conn, report_progress):
+            # Декодирование и сжатие - в процессах, запись - одной транзакцией порциями executemany
+            written, failed, batch = 0, [], []
+            with ProcessPoolExecutor() as pool:
+                results = pool.map(ingestFile, paths, repeat(settings), chunksize=4)
+                for i, (path, data, thumb, error) in enumerate(results, 1):
+                    if error:
+                        failed.append((path, error))
+                    else:
+                        value = store.put(data) if store else data
+                        batch.append((value, thumb, key_of[path]) if thumb_col else (value, key_of[path]))
+                    if len(batch) >= PHOTO_WRITE_BATCH:
+                        conn.executemany(sql, batch)
+                        written += len(batch)
+                        batch = []
+                    report_progress(i * 100 // len(paths), os.path.basename(path))
+            if batch:
+                conn.executemany(sql, batch)
+                written += len(batch)
+            return written, failed
+        
+        def on_progress(pct, name):
+            progress.setValue(pct)
+            progress.setLabelText(f"📂 Импорт фото...\n{name}")
+        
+        def on_done(result):
+            progress.close()
+            written, failed = result
+            self.displayTableData(*self.view_sort)
+            self.updateStatus(f"✅ Загружено фото: {written}")
+            if failed:
+                self.showTextDialog("Импорт фото - ошибки",
+                                    "".join(f"{os.path.basename(p)}: {e}\n" for p, e in failed))
+        
+        task = self.runWriteInBackground(run, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def deduplicatePhotos(self):
+        """Переносит повторяющиеся фото в общее хранилище, в ячейках остаются ссылки"""
+        if QMessageBox.question(self, "Повторы фото",
+                                "Найти одинаковые фото во всех таблицах и хранить каждое один раз?\n"
+                                "Ячейки получат ссылки, таблицы показывают фото как раньше."
+                                ) != QMessageBox.StandardButton.Yes:
+            return
+        progress = self.createBackgroundProgress("🧬 Поиск повторов...", busy=True)
+        
+        def on_progress(count, label):
+            progress.setLabelText(f"🧬 Поиск повторов...\n{label}: {count:,}")
+        
+        def on_done(text):
+            progress.close()
+            self.result_cache.clear()
+            self.displayTableData(*self.view_sort)
+            self.showTextDialog("Повторы фото", text)
+        
+        task = self.runWriteInBackground(self.moveDuplicatePhotos, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def moveDuplicatePhotos(self, conn, progress):
+        store = self.escape(PHOTO_STORE_TABLE)
+        conn.create_function("photo_digest", 1, photoDigest, deterministic=True)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {store} (hash TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                     "size INTEGER NOT NULL) WITHOUT ROWID")
+        cursor = conn.cursor()
+        tables = self.userTables(cursor)
+        
+        # Проход 1: хеши всех картинок; ссылки, уже указывающие в хранилище, тоже учитываем
+        places = {}
+        referenced = set()
+        for table in tables:
+            for col in self.photoColumns(cursor, table):
+                rows = conn.cursor().execute(f"SELECT rowid, {self.escape(col)} FROM {self.escape(table)} "
+                                             f"WHERE {self.escape(col)} IS NOT NULL")
+                seen = 0
+                while True:
+                    chunk = rows.fetchmany(PHOTO_EXTRACT_CHUNK)
+                    if not chunk:
+                        break
+                    for rowid, data in chunk:
+                        if isinstance(data, str) and data.startswith(PHOTO_REF_PREFIX):
+                            referenced.add(data[len(PHOTO_REF_PREFIX):])
+                        elif self.isValidImage(data):
+                            digest = photoDigest(data)
+                            places.setdefault(digest, []).append((table, col, rowid, len(data)))
+                    seen += len(chunk)
+                    progress(seen, f"{table}.{col}")
+        
+        # Проход 2: повторы и фото, уже лежащие в хранилище, заменяем ссылками - одной транзакцией.
+        # Окно немодальное: ячейку могли изменить после прохода 1, поэтому каждая запись
+        # проверяет, что в ячейке всё те же байты, а изменённые строки пропускаются
+        conn.execute("BEGIN IMMEDIATE")
+        stored = {h for (h,) in conn.execute(f"SELECT hash FROM {store}")}
+        moved, skipped, reclaimed, per_column = 0, 0, 0, {}
+        for digest, where in places.items():
+            if len(where) < 2 and digest not in stored:
+                continue
+            if digest not in stored:
+                for table, col, rowid, size in where:
+                    c = self.escape(col)
+                    if conn.execute(f"INSERT OR IGNORE INTO {store} (hash, data, size) "
+                                    f"SELECT ?, {c}, ? FROM {self.escape(table)} "
+                                    f"WHERE rowid = ? AND length({c}) = ? AND photo_digest({c}) = ?",
+                                    (digest, size, rowid, size, digest)).rowcount:
+                        break
+                else:
+                    skipped += len(where)
+                    continue
+            replaced = 0
+            for table, col, rowid, size in where:
+                c = self.escape(col)
+                if conn.execute(f"UPDATE {self.escape(table)} SET {c} = ? "
+                                f"WHERE rowid = ? AND length({c}) = ? AND photo_digest({c}) = ?",
+                                (PHOTO_REF_PREFIX + digest, rowid, size, digest)).rowcount:
+                    per_column[f"{table}.{col}"] = per_column.get(f"{table}.{col}", 0) + 1
+                    replaced += 1
+                else:
+                    skipped += 1
+            # Одна копия остаётся в хранилище, остальные байты освобождаются
+            reclaimed += size * (replaced - (0 if digest in stored else 1))
+            moved += replaced
+            referenced.add(digest)
+            progress(moved, "перенос в хранилище")
+        
+        orphans = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {store} "
+                               "WHERE hash NOT IN (SELECT value FROM json_each(?))",
+                               (json.dumps(sorted(referenced)),)).fetchone()
+        conn.execute(f"DELETE FROM {store} WHERE hash NOT IN (SELECT value FROM json_each(?))",
+                     (json.dumps(sorted(referenced)),))
+        unique = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {store}").fetchone()
+        
+        text = "🧬 ПОВТОРЫ ФОТО\n" + "="*50 + "\n\n"
+        text += f"Проверено картинок: {sum(len(w) for w in places.values()):,}\n"
+        text += f"Заменено ссылками: {moved:,}\n"
+        for where, count in sorted(per_column.items(), key=lambda p: -p[1]):
+            text += f"  {where}: {count:,}\n"
+        if skipped:
+            text += f"Пропущено (изменены во время поиска): {skipped:,}\n"
+        text += f"\nВ хранилище {PHOTO_STORE_TABLE}: {unique[0]:,} фото, {self.formatSize(unique[1])}\n"
+        if orphans[0]:
+            text += f"Удалено неиспользуемых: {orphans[0]:,}, {self.formatSize(orphans[1])}\n"
+        text += f"\n✅ Освобождено: {self.formatSize(reclaimed + orphans[1])}\n"
+        text += "💡 Файл уменьшится после сжатия (Сервис → VACUUM INTO или incremental vacuum)\n"
+        return text
+    
+    def externalizePhotos(self):
+        """Включает внешнее хранилище и переносит в него фото из всех таблиц"""
+        store = self.photo_store
+        if QMessageBox.question(self, "Фото в файлах",
+                                f"Перенести фото из базы в папку\n{store.root}?\n\n"
+                                "В ячейках останутся ссылки, новые фото тоже будут сохраняться в папку.\n"
+                                "Папку нужно копировать вместе с базой."
+                                ) != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            store.root.mkdir(exist_ok=True)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        progress = self.createBackgroundProgress("📁 Перенос фото в файлы...", busy=True)
+        
+        def on_progress(count, label):
+            progress.setLabelText(f"📁 Перенос фото в файлы...\n{label}: {count:,}")
+        
+        def on_done(text):
+            progress.close()
+            self.result_cache.clear()
+            self.displayTableData(*self.view_sort)
+            self.showTextDialog("Фото в файлах", text)
+        
+        task = self.runWriteInBackground(lambda conn, report: self.movePhotosToFiles(conn, report, store),
+                                         on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def movePhotosToFiles(self, conn, progress, store):
+        cursor = conn.cursor()
+        tables = self.userTables(cursor)
+        
+        text = "📁 ФОТО В ФАЙЛАХ\n" + "="*50 + f"\n\n📁 {store.root}\n\n"
+        total_moved = total_bytes = skipped = 0
+        for table in tables:
+            for col in self.photoColumns(cursor, table):
+                # Пока файлы пишутся на диск, ячейку могли изменить - тогда оставляем её как есть
+                update = (f"UPDATE {self.escape(table)} SET {self.escape(col)} = ? "
+                          f"WHERE rowid = ? AND {self.escape(col)} = ?")
+                select = (f"SELECT rowid, {self.escape(col)} FROM {self.escape(table)} WHERE rowid > ? "
+                          f"AND {self.escape(col)} IS NOT NULL ORDER BY rowid LIMIT {PHOTO_EXTRACT_CHUNK}")
+                last = moved = size = 0
+                while True:
+                    rows = conn.execute(select, (last,)).fetchall()
+                    if not rows:
+                        break
+                    batch = []
+                    for rowid, value in rows:
+                        data = value
+                        if isinstance(data, str) and data.startswith(PHOTO_REF_PREFIX):
+                            data = self.resolvePhotoValue(conn, data)
+                        if self.isValidImage(data):
+                            batch.append((store.put(data), rowid, value, len(data)))
+                    last = rows[-1][0]
+                    # Файлы уже на диске - при сбое или пропуске останутся лишь файлы без ссылок
+                    for ref, rowid, value, length in batch:
+                        if conn.execute(update, (ref, rowid, value)).rowcount:
+                            moved += 1
+                            size += length
+                        else:
+                            skipped += 1
+                    conn.commit()
+                    progress(moved, f"{table}.{col}")
+                if moved:
+                    text += f"✅ {table}.{col}: {moved:,}, {self.formatSize(size)}\n"
+                total_moved += moved
+                total_bytes += size
+        
+        # Фото общей таблицы, на которые больше не ссылается ни одна ячейка, уже лежат в файлах
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (PHOTO_STORE_TABLE,)).fetchone():
+            shared = self.escape(PHOTO_STORE_TABLE)
+            kept = json.dumps(sorted(self.referencedPhotos(conn, PHOTO_REF_PREFIX)))
+            freed = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {shared} "
+                                 "WHERE hash NOT IN (SELECT value FROM json_each(?))", (kept,)).fetchone()
+            conn.execute(f"DELETE FROM {shared} WHERE hash NOT IN (SELECT value FROM json_each(?))", (kept,))
+            if not conn.execute(f"SELECT 1 FROM {shared} LIMIT 1").fetchone():
+                conn.execute(f"DROP TABLE {shared}")
+            conn.commit()
+            if freed[0]:
+                text += f"🧬 Из {PHOTO_STORE_TABLE} удалено: {freed[0]:,}, {self.formatSize(freed[1])}\n"
+        text += self.prunePhotoStore(conn, store)
+        
+        files = sum(1 for p in store.root.rglob("*") if p.is_file())
+        text += f"\n✅ Перенесено: {total_moved:,} ({self.formatSize(total_bytes)}), файлов: {files:,}\n"
+        if skipped:
+            text += f"Пропущено (изменены во время переноса): {skipped:,}\n"
+        text += "💡 Файл базы уменьшится после сжатия (Сервис → VACUUM INTO или incremental vacuum)\n"
+        return text
+    
+    def prunePhotoStore(self, conn, store):
+        """Удаляет файлы внешнего хранилища, оставшиеся от заменённых и удалённых фото"""
+        started = time.time()
+        removed, size = store.prune(self.referencedPhotos(conn, PHOTO_FILE_PREFIX), started)
+        return f"🧹 Удалено файлов без ссылок: {removed:,}, {self.formatSize(size)}\n" if removed else ""
+    
+    def cleanPhotoFiles(self):
+        """Удаляет из внешнего хранилища файлы, на которые не ссылается ни одна ячейка"""
+        store = self.photo_store
+        if not store.enabled():
+            QMessageBox.information(self, "Информация", "Фото хранятся в базе, внешней папки нет")
             return
+        progress = self.createBackgroundProgress("🧹 Поиск файлов без ссылок...", busy=True)
         
-        dlg = JoinTablesDialog(self, self.current_table, self.connection)
-        if dlg.exec():
-            t2, a1, a2, typ = dlg.getData()
-            self.joinTables(t2, a1, a2, typ)
+        def on_done(text):
+            progress.close()
+            self.showTextDialog("Файлы фото", text or "✅ Файлов без ссылок нет\n")
+        
+        task = self.runInBackground(lambda conn, report: self.prunePhotoStore(conn, store), on_done)
+        task.failed.connect(lambda _: progress.close())
     
-    def selectAttributes(self):
-        if not self.current_table and not self.joined_tables:
-            QMessageBox.warning(self, "Предупреждение", "Выберите таблицу")
+    def photoFingerprint(self, col, alias=None):
+        """SQL-признак изменения ячейки фото: длина BLOB или сама ссылка"""
+        c = f"{alias}.{self.escape(col)}" if alias else self.escape(col)
+        return f"CASE typeof({c}) WHEN 'blob' THEN length({c}) ELSE {c} END"
+    
+    def updatePhotoHash(self, table, col, pk, pk_val, data):
+        """Пересчитывает хеш одного фото, если индекс похожих фото уже построен"""
+        if not self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                       (PHASH_TABLE,)).fetchone():
+            return
+        hashes, t = self.escape(PHASH_TABLE), self.escape(table)
+        if data is None:
+            self.connection.execute(f"DELETE FROM {hashes} WHERE tbl = ? AND col = ? AND rid IN "
+                                    f"(SELECT rowid FROM {t} WHERE {self.escape(pk)} = ?)", (table, col, pk_val))
+        else:
+            self.connection.execute(f"INSERT OR REPLACE INTO {hashes} (tbl, col, rid, fp, hash) "
+                                    f"SELECT ?, ?, rowid, {self.photoFingerprint(col)}, ? FROM {t} "
+                                    f"WHERE {self.escape(pk)} = ?", (table, col, photoHash(data), pk_val))
+        self.connection.commit()
+    
+    def findSimilarPhotos(self):
+        """Ищет похожие фото (пережатые, уменьшенные копии) по перцептивным хешам"""
+        threshold, ok = QInputDialog.getInt(self, "Похожие фото",
+                                            "Допустимо отличающихся бит хеша (из 64):",
+                                            PHASH_THRESHOLD, 0, 16)
+        if not ok:
             return
+        progress = self.createBackgroundProgress("🔍 Хеширование фото...", busy=True)
+        progress.setCancelButtonText("⏸ Прервать")
         
-        dlg = SelectAttributesDialog(self, self.getAllColumns(), self.selected_attributes)
-        if dlg.exec():
-            self.selected_attributes = dlg.getSelectedAttributes()
-            self.updateAttributesLabel()
-            self.displayTableData()
+        def on_progress(count, label):
+            progress.setLabelText(f"🔍 Хеширование фото...\n{label}: {count:,}")
+        
+        def on_done(text):
+            progress.close()
+            self.showTextDialog("Похожие фото", text)
+        
+        task = self.runWriteInBackground(lambda conn, report: self.matchSimilarPhotos(conn, report, threshold),
+                                         on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+        progress.canceled.connect(task.requestInterruption)
     
-    def inspectDB(self):
-        if not self.connection:
-            QMessageBox.warning(self, "Предупреждение", "Нет подключения")
+    def matchSimilarPhotos(self, conn, progress, threshold):
+        hashes = self.escape(PHASH_TABLE)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {hashes} (tbl TEXT, col TEXT, rid INTEGER, fp, hash INTEGER, "
+                     "PRIMARY KEY (tbl, col, rid)) WITHOUT ROWID")
+        conn.commit()
+        cursor = conn.cursor()
+        tables = self.userTables(cursor)
+        
+        # Хешируются только новые и изменённые ячейки; удалённые строки убираются из индекса
+        columns, hashed = [], 0
+        with ProcessPoolExecutor() as pool:
+            for table in tables:
+                for col in self.photoColumns(cursor, table):
+                    if col.endswith(PHOTO_THUMB_SUFFIX):
+                        continue  # миниатюра совпала бы со своим фото
+                    columns.append((table, col))
+                    t, c, fp = self.escape(table), self.escape(col), self.photoFingerprint(col, "x")
+                    conn.execute(f"DELETE FROM {hashes} WHERE tbl = ? AND col = ? AND rid NOT IN "
+                                 f"(SELECT rowid FROM {t} WHERE {c} IS NOT NULL)", (table, col))
+                    select = (f"SELECT x.rowid, x.{c}, {fp} FROM {t} AS x "
+                              f"LEFT JOIN {hashes} AS h ON h.tbl = ? AND h.col = ? AND h.rid = x.rowid "
+                              f"WHERE x.rowid > ? AND x.{c} IS NOT NULL AND (h.rid IS NULL OR h.fp IS NOT "
+                              f"{fp}) ORDER BY x.rowid LIMIT {PHOTO_EXTRACT_CHUNK}")
+                    last = 0
+                    while not QThread.currentThread().isInterruptionRequested():
+                        rows = conn.execute(select, (table, col, last)).fetchall()
+                        if not rows:
+                            break
+                        blobs = [self.resolvePhotoValue(conn, data) for _, data, _ in rows]
+                        results = pool.map(photoHash, blobs, chunksize=4)
+                        conn.executemany(f"INSERT OR REPLACE INTO {hashes} (tbl, col, rid, fp, hash) "
+                                         "VALUES (?, ?, ?, ?, ?)",
+                                         [(table, col, rowid, key, h) for (rowid, _, key), h in zip(rows, results)])
+                        conn.commit()
+                        last = rows[-1][0]
+                        hashed += len(rows)
+                        progress(hashed, f"{table}.{col}")
+        conn.execute(f"DELETE FROM {hashes} WHERE (tbl, col) NOT IN (SELECT json_extract(value, '$[0]'), "
+                     "json_extract(value, '$[1]') FROM json_each(?))", (json.dumps(columns),))
+        conn.commit()
+        finished = not QThread.currentThread().isInterruptionRequested()
+        
+        rows = conn.execute(f"SELECT tbl, col, rid, hash FROM {hashes} WHERE hash IS NOT NULL").fetchall()
+        progress(len(rows), "сравнение хешей")
+        pairs = similarPhotoPairs([r[3] for r in rows], threshold)
+        
+        # Пары объединяются в группы: копии одного снимка попадают в одну группу
+        parent = list(range(len(rows)))
+        
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for a, b in pairs:
+            parent[root(a)] = root(b)
+        groups = {}
+        for a, b in pairs:
+            groups.setdefault(root(a), set()).update((a, b))
+        closest = {}
+        for (a, b), d in pairs.items():
+            closest[a] = min(closest.get(a, 64), d)
+            closest[b] = min(closest.get(b, 64), d)
+        
+        text = "🔍 ПОХОЖИЕ ФОТО\n" + "="*50 + "\n\n"
+        if not finished:
+            text += "⏸ Хеширование прервано - сравнены только готовые хеши\n\n"
+        text += f"Хешей в индексе {PHASH_TABLE}: {len(rows):,} (новых и изменённых: {hashed:,})\n"
+        text += f"Порог: до {threshold} бит из 64\n"
+        text += f"Групп похожих фото: {len(groups):,}\n\n"
+        for n, members in enumerate(sorted(groups.values(), key=len, reverse=True), 1):
+            text += f"Группа {n} ({len(members)} фото):\n"
+            for i in sorted(members, key=lambda i: rows[i][:3]):
+                tbl, col, rid, _ = rows[i]
+                text += f"  {tbl}.{col} rowid={rid}  (ближайшее: {closest[i]} бит)\n"
+            text += "\n"
+        if not groups:
+            text += "✅ Похожих фото не найдено\n"
+        return text
+    
+    def transcodeCheckpoint(self, table, col):
+        """Сохранённая точка продолжения: (последний rowid, параметры) или None.
+
+        Таблица точек создаётся только запуском пережатия и удаляется, когда пустеет."""
+        if not self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                       (TRANSCODE_PROGRESS_TABLE,)).fetchone():
+            return None
+        return self.connection.execute(
+            f"SELECT last_rowid, settings, bytes_before, bytes_after FROM {self.escape(TRANSCODE_PROGRESS_TABLE)} "
+            "WHERE tbl = ? AND col = ?", (table, col)).fetchone()
+    
+    def transcodeColumn(self):
+        """Пережимает все картинки колонки порциями транзакций с возможностью продолжить"""
+        cursor = self.connection.cursor()
+        tables = self.userTables(cursor)
+        columns = {}
+        for t in tables:
+            cursor.execute(f"PRAGMA table_info({self.escape(t)})")
+            cols = [c[1] for c in cursor.fetchall() if c[2].upper() == 'BLOB']
+            if cols:
+                columns[t] = cols
+        if not columns:
+            QMessageBox.information(self, "Информация", "Нет BLOB-колонок")
+            return
+        
+        dlg = TranscodeDialog(self, columns, self.current_table, self.photo_settings)
+        if not dlg.exec():
             return
+        table, col, vacuum = dlg.getData()
+        settings = dlg.getSettings()
+        settings_key = f"{settings['format']} {settings['quality']} {settings['max_edge']}"
         
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = cursor.fetchall()
-            
-            text = "🔍 ИССЛЕДОВАНИЕ\n" + "="*50 + "\n\n"
-            text += f"📁 {os.path.basename(self.db_name)}\n"
-            text += f"📋 Таблиц: {len(tables)}\n\n"
-            
-            for t in tables:
-                name = t[0]
-                text += f"📊 {name}\n" + "-"*30 + "\n"
-                
-                cursor.execute(f"PRAGMA table_info({self.escape(name)})")
-                for col in cursor.fetchall():
-                    text += f"  - {col[1]} ({col[2]})\n"
-                
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM {self.escape(name)}")
-                    text += f"📈 Записей: {cursor.fetchone()[0]}\n"
-                except:
-                    text += "📈 Записей: -\n"
-                text += "\n"
-            
-            self.showTextDialog("Исследование", text)
+            checkpoint = self.transcodeCheckpoint(table, col)
+            total = self.connection.execute(f"SELECT MAX(rowid) FROM {self.escape(table)}").fetchone()[0] or 1
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        start = (0, 0, 0)
+        if checkpoint:
+            last, saved, before, after = checkpoint
+            reply = QMessageBox.question(self, "Продолжить",
+                                         f"Пережатие {table}.{col} ({saved}) прервано на rowid {last}.\n"
+                                         "Продолжить с этого места? (Нет - начать заново)")
+            if reply == QMessageBox.StandardButton.Yes and saved == settings_key:
+                start = (last, before, after)
+            elif reply == QMessageBox.StandardButton.Yes:
+                QMessageBox.information(self, "Информация", "Параметры изменились - начинаем заново")
+        
+        progress = self.createBackgroundProgress(f"♻️ {table}.{col}...")
+        progress.setCancelButtonText("⏸ Прервать")
+        
+        def run(conn, report):
+            last, before, after = start
+            changed = skipped = 0
+            progress_table = self.escape(TRANSCODE_PROGRESS_TABLE)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {progress_table} "
+                         "(tbl TEXT, col TEXT, settings TEXT, last_rowid INTEGER, "
+                         "bytes_before INTEGER, bytes_after INTEGER, PRIMARY KEY (tbl, col))")
+            select = (f"SELECT rowid, {self.escape(col)} FROM {self.escape(table)} "
+                      f"WHERE rowid > ? AND {self.escape(col)} IS NOT NULL ORDER BY rowid LIMIT {PHOTO_WRITE_BATCH}")
+            # Пока пережимается порция, фото могли заменить: пишем, только если в ячейке прежнее значение
+            update = (f"UPDATE {self.escape(table)} SET {self.escape(col)} = ? "
+                      f"WHERE rowid = ? AND {self.escape(col)} = ?")
+            with ProcessPoolExecutor() as pool:
+                while not QThread.currentThread().isInterruptionRequested():
+                    rows = conn.execute(select, (last,)).fetchall()
+                    if not rows:
+                        break
+                    # Ссылки на хранилища пережимаются по содержимому и остаются ссылками
+                    blobs = [self.resolvePhotoValue(conn, r[1]) for r in rows]
+                    results = pool.map(transcodeBlob, blobs, repeat(settings), chunksize=4)
+                    batch = []
+                    for (rowid, value), data, out in zip(rows, blobs, results):
+                        before += len(data) if data else 0
+                        after += len(out) if out else len(data) if data else 0
+                        if out:
+                            batch.append((self.storePhotoValue(conn, value, out), rowid, value,
+                                          len(data) - len(out)))
+                    last = rows[-1][0]
+                    # Данные и точка продолжения фиксируются одной транзакцией
+                    for new, rowid, value, saved in batch:
+                        if conn.execute(update, (new, rowid, value)).rowcount:
+                            changed += 1
+                        else:
+                            skipped += 1
+                            after += saved
+                    conn.execute(f"INSERT OR REPLACE INTO {progress_table} VALUES (?, ?, ?, ?, ?, ?)",
+                                 (table, col, settings_key, last, before, after))
+                    conn.commit()
+                    report(min(100, last * 100 // total), f"rowid {last:,} | пережато {changed:,}")
+            
+            finished = not QThread.currentThread().isInterruptionRequested()
+            if finished:
+                conn.execute(f"DELETE FROM {progress_table} WHERE tbl = ? AND col = ?", (table, col))
+                if not conn.execute(f"SELECT 1 FROM {progress_table} LIMIT 1").fetchone():
+                    conn.execute(f"DROP TABLE {progress_table}")
+                conn.commit()
+                if vacuum:
+                    report(100, "VACUUM...")
+                    conn.execute("VACUUM")
+            return finished, changed, skipped, before, after
+        
+        def on_progress(pct, label):
+            progress.setValue(pct)
+            progress.setLabelText(f"♻️ {table}.{col}...\n{label}")
+        
+        def on_done(result):
+            progress.close()
+            finished, changed, skipped, before, after = result
+            text = "♻️ ПЕРЕЖАТИЕ ФОТО\n" + "="*50 + "\n\n"
+            text += f"📋 {table}.{col} → {settings['format']} {settings['quality']}%, до {settings['max_edge']}px\n"
+            text += f"{'✅ Завершено' if finished else '⏸ Прервано - можно продолжить позже'}\n\n"
+            text += f"Пережато: {changed:,}\n"
+            if skipped:
+                text += f"Пропущено (изменены во время пережатия): {skipped:,}\n"
+            text += f"До: {self.formatSize(before)}\nПосле: {self.formatSize(after)}\n"
+            if before:
+                text += f"Экономия: {self.formatSize(before - after)} ({(before - after) / before * 100:.0f}%)\n"
+            self.displayTableData(*self.view_sort)
+            self.showTextDialog("Пережатие фото", text)
+        
+        task = self.runWriteInBackground(run, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+        progress.canceled.connect(task.requestInterruption)
     
-    def findAllPhotos(self):
+    def showServiceMenu(self):
         if not self.connection:
             QMessageBox.warning(self, "Предупреждение", "Нет подключения")
             return
+        menu = QMenu()
+        menu.setFont(QFont("Arial", 10))
+        items = [
+            ("💽 Анализ хранилища", self.analyzeStorage),
+            ("📦 Резервная копия", self.backupDatabase),
+            ("🗜 Сжатая копия (VACUUM INTO)", self.compactCopy),
+            ("🧹 Освободить место (incremental vacuum)", self.incrementalVacuum),
+        ]
+        actions = {menu.addAction(text): callback for text, callback in items}
+        action = menu.exec(QCursor.pos())
+        if action in actions:
+            actions[action]()
+    
+    def createBackgroundProgress(self, text, busy=False):
+        """Немодальный индикатор для фоновых задач: приложение остаётся доступным"""
+        progress = QProgressDialog(text, None, 0, 0 if busy else 100, self)
+        progress.setWindowTitle("Обслуживание")
+        progress.setMinimumDuration(0)
+        progress.setValue(0)
+        progress.show()
+        return progress
+    
+    def askCopyPath(self, title, suffix):
+        stem = Path(self.db_name).stem
+        default = f"{stem}_{suffix}_{datetime.now():%Y%m%d_%H%M}.db"
+        path, _ = QFileDialog.getSaveFileName(self, title, default, "SQLite (*.db)")
+        if path and os.path.abspath(path) == os.path.abspath(self.db_name):
+            QMessageBox.warning(self, "Предупреждение", "Нельзя записать копию поверх открытой базы")
+            return None
+        return path
+    
+    def backupDatabase(self):
+        """Онлайн-копия через Connection.backup порциями страниц с соединения из пула"""
+        path = self.askCopyPath("Резервная копия", "backup")
+        if not path:
+            return
+        # В копию попадают только сохранённые изменения
+        self.connection.commit()
+        progress = self.createBackgroundProgress("📦 Резервное копирование...")
+        store = self.photo_store
         
-        try:
-            cursor = self.connection.cursor()
-            tables = cursor.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-            
-            total = 0
-            text = "🖼️ ПОИСК ФОТО\n" + "="*50 + "\n\n"
+        def backup(conn, report):
+            target = sqlite3.connect(path)
+            try:
+                conn.backup(target, pages=BACKUP_PAGES_PER_STEP,
+                            progress=lambda status, remaining, total: report(
+                                (total - remaining) * 100 // total if total else 100,
+                                f"{total - remaining:,} / {total:,} страниц"))
+            finally:
+                target.close()
+            if store.enabled():
+                # Без папки фото ссылки photo:file: в копии вели бы в никуда
+                report(100, "папка фото...")
+                store.copyTo(path)
+            return os.path.getsize(path)
+        
+        def on_progress(pct, label):
+            progress.setValue(pct)
+            progress.setLabelText(f"📦 Резервное копирование...\n{label}")
+        
+        def on_done(size):
+            progress.close()
+            extra = f" + {PhotoStore(path).root.name}" if store.enabled() else ""
+            self.updateStatus(f"✅ Копия {os.path.basename(path)}{extra}: {self.formatSize(size)}")
+        
+        task = self.runInBackground(backup, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def compactCopy(self):
+        """VACUUM INTO: дефрагментированная копия без freelist, открытая база не блокируется"""
+        path = self.askCopyPath("Сжатая копия", "compact")
+        if not path:
+            return
+        progress = self.createBackgroundProgress("🗜 Создание сжатой копии...", busy=True)
+        started = time.monotonic()
+        before = os.path.getsize(self.db_name)
+        store = self.photo_store
+        
+        def vacuum(conn, report):
+            # VACUUM INTO не пишет в существующий файл, перезапись уже подтверждена в диалоге
+            if os.path.exists(path):
+                os.remove(path)
+            ticks = [0]
             
-            for t in tables:
-                name = t[0]
-                text += f"📋 {name}\n"
-                
-                cursor.execute(f"PRAGMA table_info({self.escape(name)})")
-                cols = cursor.fetchall()
-                
-                found = 0
-                for col in cols:
-                    if col[2].upper() == 'BLOB' or any(k in col[1].lower() for k in ['photo', 'image', 'pic', 'фото']):
-                        text += f"  🔍 {col[1]} ({col[2]})\n"
-                        
-                        cursor.execute(f"SELECT rowid, {col[1]} FROM {name} WHERE {col[1]} IS NOT NULL")
-                        for rowid, data in cursor.fetchall():
-                            if isinstance(data, bytes) and len(data) > 100:
-                                fname = f"photo_{name}_{col[1]}_{rowid}.jpg"
-                                try:
-                                    with open(fname, 'wb') as f:
-                                        f.write(data)
-                                    text += f"    ✅ {fname} ({len(data)} bytes)\n"
-                                    total += 1
-                                    found += 1
-                                except Exception as e:
-                                    text += f"    ❌ {e}\n"
-                
-                if found:
-                    text += f"  📊 Найдено: {found}\n"
-                else:
-                    text += "  ❌ Нет фото\n"
-                text += "\n"
+            def tick():
+                ticks[0] += 1
+                report(ticks[0], "")
+                return 0
             
-            if total:
-                text += f"✅ Всего: {total}\n"
+            conn.set_progress_handler(tick, QUERY_PROGRESS_STEPS)
+            conn.execute("VACUUM INTO ?", (path,))
+            conn.set_progress_handler(None, 0)
+            if store.enabled():
+                store.copyTo(path)
+            return os.path.getsize(path)
+        
+        def on_progress(ticks, _):
+            progress.setLabelText(f"🗜 Создание сжатой копии...\n⏱ {time.monotonic() - started:.1f} с | "
+                                  f"Операций: {ticks * QUERY_PROGRESS_STEPS:,}")
+        
+        def on_done(size):
+            progress.close()
+            extra = f" + {PhotoStore(path).root.name}" if store.enabled() else ""
+            self.updateStatus(f"✅ {os.path.basename(path)}{extra}: "
+                              f"{self.formatSize(before)} → {self.formatSize(size)}")
+        
+        task = self.runWriteInBackground(vacuum, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def incrementalVacuum(self):
+        """Возвращает свободные страницы файлу порциями, если auto_vacuum=INCREMENTAL"""
+        if self.connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            QMessageBox.information(self, "Информация",
+                                    "В этой базе auto_vacuum не INCREMENTAL.\n"
+                                    "Чтобы уменьшить файл, создайте сжатую копию (VACUUM INTO).")
+            return
+        free = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            QMessageBox.information(self, "Информация", "Свободных страниц нет")
+            return
+        
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        progress = self.createBackgroundProgress("🧹 Освобождение места...")
+        
+        def vacuum(conn, report):
+            remaining = free
+            while remaining:
+                # Каждая порция - своя транзакция, чтобы не держать блокировку записи долго.
+                # executescript: через execute модуль sqlite3 освобождает лишь одну страницу
+                conn.executescript(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES});")
+                left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if left >= remaining:
+                    break
+                remaining = left
+                report((free - remaining) * 100 // free, f"{free - remaining:,} / {free:,} страниц")
+            return (free - remaining) * page_size
+        
+        def on_progress(pct, label):
+            progress.setValue(pct)
+            progress.setLabelText(f"🧹 Освобождение места...\n{label}")
+        
+        def on_done(size):
+            progress.close()
+            self.updateStatus(f"✅ Освобождено {self.formatSize(size)}")
+        
+        task = self.runWriteInBackground(vacuum, on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def formatSize(self, size):
+        for unit in ("Б", "КБ", "МБ", "ГБ"):
+            if abs(size) < 1024 or unit == "ГБ":
+                return f"{size:,.0f} {unit}" if unit == "Б" else f"{size:,.1f} {unit}"
+            size /= 1024
+    
+    def analyzeStorage(self):
+        """Отчёт о месте в файле: таблицы, индексы, BLOB-колонки, overflow и freelist"""
+        self.updateStatus("💽 Анализ хранилища...")
+        self.runInBackground(self.buildStorageReport,
+                             lambda text: self.showTextDialog("Хранилище", text),
+                             lambda i, name: self.updateStatus(f"💽 {name}..."))
+    
+    def buildStorageReport(self, conn, progress):
+        cursor = conn.cursor()
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        objects = cursor.execute("SELECT name, type, tbl_name FROM sqlite_master "
+                                 "WHERE type IN ('table', 'index') ORDER BY tbl_name, type DESC, name").fetchall()
+        
+        text = "💽 ХРАНИЛИЩЕ\n" + "="*50 + "\n\n"
+        text += f"📁 {os.path.basename(self.db_name)}: {self.formatSize(page_size * page_count)}\n"
+        text += f"📄 Страниц: {page_count:,} по {self.formatSize(page_size)}\n"
+        text += (f"🕳 Свободных страниц (freelist): {freelist:,} = {self.formatSize(freelist * page_size)} "
+                 f"({freelist / page_count * 100 if page_count else 0:.1f}%)\n\n")
+        
+        try:
+            # Требует SQLITE_ENABLE_DBSTAT_VTAB, обычно включён в сборках Python
+            stats = {row[0]: row[1:] for row in cursor.execute(
+                "SELECT name, SUM(pgsize), SUM(payload), SUM(unused), "
+                "SUM(CASE WHEN pagetype = 'overflow' THEN pgsize ELSE 0 END), COUNT(*) "
+                "FROM dbstat GROUP BY name")}
+        except sqlite3.Error:
+            stats = None
+            text += "⚠ dbstat недоступен - размеры таблиц по сумме байтов значений, индексы не оцениваются\n\n"
+        
+        if stats is not None:
+            text += "📊 ОБЪЕКТЫ (по dbstat)\n" + "-"*50 + "\n"
+            rows = []
+            for name, typ, table in objects:
+                if name in stats:
+                    size, payload, unused, overflow, pages = stats[name]
+                    rows.append((size, name, typ, table, payload, unused, overflow, pages))
+            for size, name, typ, table, payload, unused, overflow, pages in sorted(rows, reverse=True):
+                kind = "📋" if typ == "table" else "🔑"
+                owner = f" ({table})" if typ == "index" else ""
+                text += f"{kind} {name}{owner}: {self.formatSize(size)}, страниц {pages:,}\n"
+                text += (f"     данные {self.formatSize(payload)}, пусто {self.formatSize(unused)}, "
+                         f"overflow {self.formatSize(overflow)} ({overflow / size * 100 if size else 0:.0f}%)\n")
+            text += "\n"
+        
+        text += "🖼 КОЛОНКИ (байты значений)\n" + "-"*50 + "\n"
+        tables = [name for name, typ, _ in objects if typ == "table" and not name.startswith("sqlite_")]
+        for i, table in enumerate(tables):
+            progress(i, table)
+            cols = cursor.execute(f"PRAGMA table_info({self.escape(table)})").fetchall()
+            if not cols:
+                continue
+            # length() у TEXT считает символы, байты - через CAST AS BLOB (кириллица - 2 байта).
+            # У BLOB length() от самой колонки берётся из заголовка записи без чтения overflow
+            sums = ", ".join(f"SUM(CASE typeof({c}) WHEN 'text' THEN length(CAST({c} AS BLOB)) ELSE length({c}) END)"
+                             for c in (self.escape(col[1]) for col in cols))
+            totals = cursor.execute(f"SELECT COUNT(*), {sums} FROM {self.escape(table)}").fetchone()
+            count, lengths = totals[0], [n or 0 for n in totals[1:]]
+            total = sum(lengths)
+            text += f"📋 {table}: {count:,} строк, значения {self.formatSize(total)}\n"
+            for col, size in sorted(zip(cols, lengths), key=lambda p: -p[1]):
+                blob = col[2].upper() == "BLOB"
+                if not blob and size < total * 0.1:
+                    continue
+                avg = size / count if count else 0
+                text += (f"   {'🖼' if blob else '  '} {col[1]} ({col[2]}): {self.formatSize(size)}, "
+                         f"в среднем {self.formatSize(avg)}/строка\n")
+        
+        return text
+    
+    def findAllPhotos(self):
+        """Выгружает все фото базы в папку или ZIP, в фоне и потоково"""
+        box = QMessageBox(self)
+        box.setWindowTitle("Выгрузка фото")
+        box.setText("Куда выгрузить фото?")
+        folder_btn = box.addButton("📁 В папку", QMessageBox.ButtonRole.AcceptRole)
+        zip_btn = box.addButton("🗜 В ZIP", QMessageBox.ButtonRole.AcceptRole)
+        box.addButton(QMessageBox.StandardButton.Cancel)
+        box.exec()
+        zip_mode = box.clickedButton() == zip_btn
+        if box.clickedButton() == folder_btn:
+            target = QFileDialog.getExistingDirectory(self, "Папка для фото")
+        elif zip_mode:
+            default = f"{Path(self.db_name).stem}_photos.zip"
+            target, _ = QFileDialog.getSaveFileName(self, "ZIP с фото", default, "ZIP (*.zip)")
+        else:
+            return
+        if not target:
+            return
+        
+        progress = self.createBackgroundProgress("🖼️ Выгрузка фото...", busy=True)
+        
+        def on_progress(count, where):
+            progress.setLabelText(f"🖼️ Выгрузка фото...\n{where}: {count:,}")
+        
+        def on_done(text):
+            progress.close()
+            self.showTextDialog("Результаты", text)
+        
+        task = self.runInBackground(
+            lambda conn, report: self.extractPhotos(conn, report, target, zip_mode),
+            on_done, on_progress)
+        task.failed.connect(lambda _: progress.close())
+    
+    def extractPhotos(self, conn, progress, target, zip_mode=False):
+        """Потоково читает BLOB-колонки и пишет картинки с расширением по сигнатуре.
+
+        Содержимое, уже лежащее в папке (или встреченное раньше), пропускается по SHA-256."""
+        seen = set()
+        sink = None
+        with ThreadPoolExecutor(PHOTO_EXTRACT_THREADS) as pool:
+            if zip_mode:
+                # Картинки уже сжаты - храним без повторного сжатия
+                sink = zipfile.ZipFile(target, "w", zipfile.ZIP_STORED)
             else:
-                text += "⚠ Фото не найдены\n"
+                existing = [p for p in Path(target).iterdir()
+                            if p.is_file() and p.suffix.lower() in PHOTO_EXTENSIONS]
+                seen.update(pool.map(lambda p: hashlib.sha256(p.read_bytes()).hexdigest(), existing))
             
-            self.showTextDialog("Результаты", text)
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", str(e))
+            try:
+                return self.extractPhotoColumns(conn, progress, target, pool, sink, seen)
+            finally:
+                if sink:
+                    sink.close()
+    
+    def extractPhotoColumns(self, conn, progress, target, pool, sink, seen):
+        cursor = conn.cursor()
+        tables = self.userTables(cursor)
+        
+        text = "🖼️ ВЫГРУЗКА ФОТО\n" + "="*50 + f"\n\n📁 {target}\n\n"
+        total = skipped = 0
+        for table in tables:
+            for col in self.photoColumns(cursor, table):
+                where = f"{table}.{col}"
+                written = dupes = 0
+                try:
+                    rows = conn.cursor().execute(f"SELECT rowid, {self.escape(col)} FROM {self.escape(table)} "
+                                                 f"WHERE {self.escape(col)} IS NOT NULL")
+                except sqlite3.Error as e:
+                    text += f"❌ {where}: {e}\n"
+                    continue
+                while True:
+                    chunk = rows.fetchmany(PHOTO_EXTRACT_CHUNK)
+                    if not chunk:
+                        break
+                    # Ссылки на общую таблицу и внешнее хранилище разрешаются в байты
+                    images = [(rowid, self.resolvePhotoValue(conn, data)) for rowid, data in chunk]
+                    images = [(rowid, data) for rowid, data in images if self.isValidImage(data)]
+                    writes = []
+                    for (rowid, data), digest in zip(images, pool.map(lambda r: hashlib.sha256(r[1]).hexdigest(),
+                                                                      images)):
+                        if digest in seen:
+                            dupes += 1
+                            continue
+                        seen.add(digest)
+                        name = re.sub(r'[\\/:*?"<>|]', "_", f"photo_{table}_{col}_{rowid}.{imageFormat(data)}")
+                        if sink:
+                            sink.writestr(name, data)
+                        else:
+                            writes.append(pool.submit(Path(target, name).write_bytes, data))
+                        written += 1
+                    for w in writes:
+                        w.result()
+                    progress(written + dupes, where)
+                
+                if written or dupes:
+                    text += f"✅ {where}: {written} (уже выгружено: {dupes})\n"
+                total += written
+                skipped += dupes
+        
+        text += f"\n✅ Всего: {total}, пропущено повторов: {skipped}\n" if total or skipped else "⚠ Фото не найдены\n"
+        return text
     
-    def showTextDialog(self, title, text):
+    def showTextDialog(self, title, text, modal=True):
+        """Окно с текстом; с modal=False не блокирует и возвращает поле для обновления"""
         dlg = QDialog(self)
         dlg.setWindowTitle(title)
         dlg.setGeometry(100, 100, 800, 600)
@@ -1861,7 +4972,7 @@ class ModernDatabaseApp(QMainWindow):
         
         btns = QHBoxLayout()
         save = QPushButton("💾 Сохранить")
-        save.clicked.connect(lambda: self.saveText(text, title))
+        save.clicked.connect(lambda: self.saveText(edit.toPlainText(), title))
         close = QPushButton("❌ Закрыть")
         close.clicked.connect(dlg.close)
         
@@ -1873,6 +4984,9 @@ class ModernDatabaseApp(QMainWindow):
         layout.addLayout(btns)
         applyTextFit(dlg)
         dlg.setMinimumSize(550, 450)
+        if not modal:
+            dlg.show()
+            return edit
         dlg.exec()
     
     def saveText(self, text, title):
@@ -1908,19 +5022,20 @@ class ModernDatabaseApp(QMainWindow):
             cursor.execute(f"PRAGMA table_info({self.escape(self.current_table)})")
             cols = [c[1] for c in cursor.fetchall()]
             
-            for _, row in df.iterrows():
-                vals = []
-                for c in cols:
-                    if c in df.columns:
-                        v = row[c]
-                        vals.append(None if pd.isna(v) else v)
-                    else:
-                        vals.append(None)
+            with self.tunedFor("bulk_import"):
+                for _, row in df.iterrows():
+                    vals = []
+                    for c in cols:
+                        if c in df.columns:
+                            v = row[c]
+                            vals.append(None if pd.isna(v) else v)
+                        else:
+                            vals.append(None)
+                    
+                    place = ", ".join(["?"] * len(cols))
+                    cursor.execute(f"INSERT INTO {self.escape(self.current_table)} VALUES ({place})", vals)
                 
-                place = ", ".join(["?"] * len(cols))
-                cursor.execute(f"INSERT INTO {self.escape(self.current_table)} VALUES ({place})", vals)
-            
-            self.connection.commit()
+                self.connection.commit()
             self.displayTableData()
             self.updateStatus(f"✅ Импортировано из {os.path.basename(path)}")
         except Exception as e:
@@ -1943,9 +5058,9 @@ class ModernDatabaseApp(QMainWindow):
         
         try:
             query, cols = self.buildQuery()
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            rows = self.runQuery(query)
+            if rows is None:
+                return
             
             from openpyxl import Workbook
             from openpyxl.drawing.image import Image as ExcelImage
@@ -2059,9 +5174,9 @@ class ModernDatabaseApp(QMainWindow):
         
         try:
             query, cols = self.buildQuery()
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            rows = self.runQuery(query)
+            if rows is None:
+                return
             
             if not rows:
                 QMessageBox.information(self, "Информация", "Нет данных")
@@ -2319,7 +5434,7 @@ class BooleanEditDialog(QDialog):
 
 
 class PhotoDialog(QDialog):
-    def __init__(self, parent, name):
+    def __init__(self, parent, name, settings=PHOTO_INGEST):
         super().__init__(parent)
         self.setWindowTitle(f"Добавить фото - {name}")
         self.setGeometry(300, 300, 500, 400)
@@ -2338,6 +5453,29 @@ class PhotoDialog(QDialog):
         self.info = QLabel("")
         layout.addWidget(self.info)
         
+        ingest = QHBoxLayout()
+        ingest.addWidget(QLabel("Формат:"))
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(["JPEG", "WEBP"])
+        self.format_combo.setCurrentText(settings["format"])
+        ingest.addWidget(self.format_combo)
+        ingest.addWidget(QLabel("Качество:"))
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(10, 100)
+        self.quality_spin.setValue(settings["quality"])
+        ingest.addWidget(self.quality_spin)
+        ingest.addWidget(QLabel("Сторона до:"))
+        self.edge_spin = QSpinBox()
+        self.edge_spin.setRange(256, 8192)
+        self.edge_spin.setSingleStep(256)
+        self.edge_spin.setValue(settings["max_edge"])
+        ingest.addWidget(self.edge_spin)
+        layout.addLayout(ingest)
+        
+        self.thumb_check = QCheckBox(f"Сохранять миниатюру ({PHOTO_THUMB_EDGE}px) в колонку *{PHOTO_THUMB_SUFFIX}")
+        self.thumb_check.setChecked(settings["thumbnail"])
+        layout.addWidget(self.thumb_check)
+        
         btns = QHBoxLayout()
         select = QPushButton("📁 Выбрать")
         select.clicked.connect(self.loadImage)
@@ -2351,7 +5489,7 @@ class PhotoDialog(QDialog):
         btns.addWidget(cancel)
         layout.addLayout(btns)
         
-        tips = QLabel("💡 PNG, JPG, GIF, BMP | до 5 МБ")
+        tips = QLabel("💡 PNG, JPG, GIF, BMP, WEBP | поворачивается по EXIF и сжимается при сохранении")
         tips.setStyleSheet("color: gray; font-size: 10px;")
         layout.addWidget(tips)
         applyTextFit(self)
@@ -2359,7 +5497,7 @@ class PhotoDialog(QDialog):
     
     def loadImage(self):
         path, _ = QFileDialog.getOpenFileName(self, "Выберите изображение", "",
-                                              "Images (*.png *.jpg *.jpeg *.gif *.bmp)")
+                                              "Images (*.png *.jpg *.jpeg *.gif *.bmp *.webp)")
         if path:
             try:
                 with open(path, 'rb') as f:
@@ -2381,6 +5519,174 @@ class PhotoDialog(QDialog):
     
     def getImageData(self):
         return self.data
+    
+    def getSettings(self):
+        return {"max_edge": self.edge_spin.value(), "format": self.format_combo.currentText(),
+                "quality": self.quality_spin.value(), "thumbnail": self.thumb_check.isChecked()}
+
+
+class PhotoGalleryModel(QAbstractListModel):
+    """Ленивая модель галереи: в памяти только rowid и подписи.
+
+    Миниатюры запрашиваются, когда строка отрисовывается, и хранятся в LRU
+    не больше GALLERY_CACHE_PIXMAPS штук."""
+
+    def __init__(self, keys, loader, parent=None):
+        super().__init__(parent)
+        self.keys = keys
+        self.loader = loader
+        self.pixmaps = OrderedDict()
+        self.painted = set()
+        self.page = 1
+        self.window = (0, -1)
+        self.placeholder = QPixmap(GALLERY_ICON_EDGE, GALLERY_ICON_EDGE)
+        self.placeholder.fill(QColor("#edf2f7"))
+        self.broken = QApplication.style().standardIcon(
+            QStyle.StandardPixmap.SP_MessageBoxWarning).pixmap(GALLERY_ICON_EDGE // 2)
+        # Отрисовки одного кадра собираются в один запрос к загрузчику
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(30)
+        self.timer.timeout.connect(self.prefetch)
+        loader.loaded.connect(self.onLoaded)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(self.keys[row][1])
+        if role == Qt.ItemDataRole.DecorationRole:
+            self.painted.add(row)
+            if not self.timer.isActive():
+                self.timer.start()
+            if row in self.pixmaps:
+                self.pixmaps.move_to_end(row)
+                return self.pixmaps[row] or self.broken
+            return self.placeholder
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"rowid {self.keys[row][0]}"
+        return None
+
+    def prefetch(self):
+        """Очередь загрузки: видимые строки, затем экраны ниже и выше"""
+        if not self.painted:
+            return
+        lo, hi = min(self.painted), max(self.painted)
+        missing = any(r not in self.pixmaps for r in self.painted)
+        self.painted.clear()
+        self.page = min(max(self.page, hi - lo + 1),
+                        GALLERY_CACHE_PIXMAPS // (1 + 2 * GALLERY_PREFETCH_PAGES))
+        ahead = self.page * GALLERY_PREFETCH_PAGES
+        last = len(self.keys) - 1
+        # Перерисовка уже загруженных строк внутри подгруженного окна ничего не меняет
+        if not missing and self.window[0] <= max(0, lo - ahead // 2) \
+                and min(last, hi + ahead // 2) <= self.window[1]:
+            return
+        self.window = (max(0, lo - ahead), min(last, hi + ahead))
+        order = chain(range(lo, hi + 1), range(hi + 1, self.window[1] + 1),
+                      range(lo - 1, self.window[0] - 1, -1))
+        self.loader.request([(r, self.keys[r][0]) for r in order if r not in self.pixmaps])
+
+    def onLoaded(self, row, image):
+        self.pixmaps[row] = QPixmap.fromImage(image) if image is not None else None
+        self.pixmaps.move_to_end(row)
+        while len(self.pixmaps) > GALLERY_CACHE_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class PhotoGalleryDialog(QDialog):
+    """Галерея одной колонки фото: значки QListView поверх ленивой модели"""
+
+    def __init__(self, parent, table, col, keys, thumb=None):
+        super().__init__(parent)
+        self.app = parent
+        self.table = table
+        self.col = col
+        self.thumb = thumb
+        
+        self.setWindowTitle(f"Галерея - {table}.{col} ({len(keys):,} фото)")
+        self.setGeometry(100, 100, 1000, 700)
+        self.setFont(QFont("Arial", 10))
+        layout = QVBoxLayout(self)
+        
+        edge = GALLERY_ICON_EDGE
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setMovement(QListView.Movement.Static)
+        # Одинаковый размер значков: раскладка 50 000 строк не опрашивает каждую
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.view.setBatchSize(1000)
+        self.view.setIconSize(QSize(edge, edge))
+        self.view.setGridSize(QSize(edge + 24, edge + 36))
+        self.view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.view.setStyleSheet("QListView { background-color: #ffffff; }")
+        
+        self.loader = PhotoGalleryLoader(parent.read_pool, self.loadThumbnail, self)
+        self.model = PhotoGalleryModel(keys, self.loader, self)
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self.openPhoto)
+        layout.addWidget(self.view)
+        
+        info = QLabel("Двойной щелчок - открыть фото")
+        info.setStyleSheet("color: #718096;")
+        layout.addWidget(info)
+        
+        btn = QPushButton("Закрыть")
+        btn.clicked.connect(self.accept)
+        layout.addWidget(btn)
+        
+        self.loader.start()
+    
+    def photoBytes(self, conn, rowid, thumbnail):
+        """Байты фото (или миниатюры) строки; ссылки на хранилища разрешаются здесь"""
+        cols = [self.col] + ([self.thumb] if thumbnail and self.thumb else [])
+        row = conn.execute(f"SELECT {', '.join(self.app.escape(c) for c in cols)} "
+                           f"FROM {self.app.escape(self.table)} WHERE rowid = ?", (rowid,)).fetchone()
+        if not row:
+            return None
+        return self.app.resolvePhotoValue(conn, row[-1] if row[-1] is not None else row[0])
+    
+    def loadThumbnail(self, conn, rowid):
+        """Выполняется в потоке загрузчика: QImage можно создавать вне GUI-потока, QPixmap - нет"""
+        data = self.photoBytes(conn, rowid, True)
+        if not data or imageFormat(data) is None:
+            return None
+        edge = GALLERY_ICON_EDGE
+        try:
+            img = Image.open(BytesIO(data))
+            img.draft("RGB", (edge, edge))  # JPEG сразу декодируется уменьшенным
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            img = img.convert("RGBA")
+        except Exception:
+            return None
+        return QImage(img.tobytes(), img.width, img.height, img.width * 4,
+                      QImage.Format.Format_RGBA8888).copy()
+    
+    def openPhoto(self, index):
+        rowid, key = self.model.keys[index.row()]
+        try:
+            data = self.photoBytes(self.app.connection, rowid, False)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        if data:
+            self.app.viewImage(self.col, data, f"[{key}]")
+        else:
+            QMessageBox.warning(self, "Предупреждение", "Нет фото")
+    
+    def done(self, result):
+        self.loader.stop()
+        super().done(result)
 
 
 class ImageViewDialog(QDialog):
@@ -2576,6 +5882,14 @@ class AddColumnDialog(QDialog):
         self.default_edit.setFont(QFont("Arial", 10))
         layout.addWidget(self.default_edit)
         
+        # Для новой таблицы существующих строк нет
+        self.fill_edit = QLineEdit()
+        self.fill_edit.setFont(QFont("Arial", 10))
+        self.fill_edit.setPlaceholderText("как по умолчанию")
+        if table:
+            layout.addWidget(QLabel("Для существующих строк (необязательно):"))
+            layout.addWidget(self.fill_edit)
+        
         help_text = "💡 TEXT - текст\n💡 INTEGER - целые\n💡 REAL - дробные\n💡 BOOLEAN - да/нет\n💡 BLOB - фото"
         help_label = QLabel(help_text)
         help_label.setStyleSheet("color: gray; font-size: 10px;")
@@ -2597,6 +5911,251 @@ class AddColumnDialog(QDialog):
         typ = self.type_combo.currentText()
         default = self.default_edit.text().strip()
         return name, typ, default if default else None
+    
+    def getFillValue(self):
+        fill = self.fill_edit.text().strip()
+        return fill if fill else None
+
+
+class BulkUpdateDialog(QDialog):
+    def __init__(self, parent, cols, cur, selected, total):
+        super().__init__(parent)
+        self.setWindowTitle("Массовое изменение")
+        self.setGeometry(300, 300, 400, 300)
+        self.setFont(QFont("Arial", 10))
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("✏️ Установить значение колонки"))
+        
+        layout.addWidget(QLabel("Колонка:"))
+        self.col_combo = QComboBox()
+        self.col_combo.setFont(QFont("Arial", 10))
+        self.col_combo.addItems(cols)
+        if cur in cols:
+            self.col_combo.setCurrentText(cur)
+        layout.addWidget(self.col_combo)
+        
+        layout.addWidget(QLabel("Значение (пусто = NULL):"))
+        self.value_edit = QLineEdit()
+        self.value_edit.setFont(QFont("Arial", 10))
+        layout.addWidget(self.value_edit)
+        
+        self.group = QButtonGroup(self)
+        sel_btn = QRadioButton(f"Выделенные строки ({selected})")
+        all_btn = QRadioButton(f"Все показанные строки ({total})")
+        self.group.addButton(sel_btn, 1)
+        self.group.addButton(all_btn, 0)
+        sel_btn.setEnabled(selected > 0)
+        (sel_btn if selected else all_btn).setChecked(True)
+        layout.addWidget(sel_btn)
+        layout.addWidget(all_btn)
+        
+        btns = QHBoxLayout()
+        ok = QPushButton("✅ Применить")
+        ok.clicked.connect(self.accept)
+        cancel = QPushButton("❌ Отмена")
+        cancel.clicked.connect(self.reject)
+        btns.addWidget(ok)
+        btns.addWidget(cancel)
+        layout.addLayout(btns)
+        applyTextFit(self)
+        self.setMinimumSize(380, 300)
+    
+    def getData(self):
+        return (self.col_combo.currentText(), self.value_edit.text().strip(),
+                self.group.checkedId() == 1)
+
+
+class IndexManagerDialog(QDialog):
+    def __init__(self, parent, indexes, suggestions):
+        super().__init__(parent)
+        self.setWindowTitle("Индексы")
+        self.setGeometry(300, 300, 600, 450)
+        self.setFont(QFont("Arial", 10))
+        self.suggestions = suggestions
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"⚡ Индексы базы ({len(indexes)})"))
+        
+        table = QTableWidget(len(indexes), 4)
+        table.setHorizontalHeaderLabels(["Индекс", "Таблица", "Колонки", "Размер"])
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        for r, (name, tbl, cols, size) in enumerate(indexes):
+            text = "-" if size is None else f"{size / 1024:,.0f} КБ"
+            for c, val in enumerate((name, tbl, cols, text)):
+                table.setItem(r, c, QTableWidgetItem(val))
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(table)
+        
+        layout.addWidget(QLabel("💡 Рекомендации для текущего вида:"))
+        self.suggestion_list = QListWidget()
+        for t, c, reason in suggestions:
+            self.suggestion_list.addItem(f"{t}.{c} - {reason}, полное сканирование")
+        if not suggestions:
+            self.suggestion_list.addItem("Все колонки соединений и сортировки проиндексированы")
+            self.suggestion_list.setEnabled(False)
+        else:
+            self.suggestion_list.setCurrentRow(0)
+        layout.addWidget(self.suggestion_list)
+        
+        btns = QHBoxLayout()
+        create = QPushButton("⚡ Создать индекс")
+        create.clicked.connect(self.accept)
+        create.setEnabled(bool(suggestions))
+        close = QPushButton("❌ Закрыть")
+        close.clicked.connect(self.reject)
+        btns.addWidget(create)
+        btns.addStretch()
+        btns.addWidget(close)
+        layout.addLayout(btns)
+        applyTextFit(self)
+        self.setMinimumSize(500, 400)
+    
+    def getSelectedSuggestion(self):
+        row = self.suggestion_list.currentRow()
+        if 0 <= row < len(self.suggestions):
+            return self.suggestions[row]
+        return None
+
+
+class BulkPhotoImportDialog(QDialog):
+    def __init__(self, parent, table, columns, image_columns):
+        super().__init__(parent)
+        self.setWindowTitle("Импорт фото из папки")
+        self.setGeometry(300, 300, 500, 420)
+        self.setFont(QFont("Arial", 10))
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"📂 Фото в '{table}' по именам файлов"))
+        
+        layout.addWidget(QLabel("Папка:"))
+        folder = QHBoxLayout()
+        self.folder_edit = QLineEdit()
+        folder.addWidget(self.folder_edit)
+        browse = QPushButton("📁 Обзор")
+        browse.clicked.connect(self.browse)
+        folder.addWidget(browse)
+        layout.addLayout(folder)
+        
+        self.recursive_check = QCheckBox("Включая вложенные папки")
+        layout.addWidget(self.recursive_check)
+        
+        layout.addWidget(QLabel("Колонка ключа:"))
+        self.key_combo = QComboBox()
+        self.key_combo.addItems(columns)
+        layout.addWidget(self.key_combo)
+        
+        layout.addWidget(QLabel("Колонка фото:"))
+        self.photo_combo = QComboBox()
+        self.photo_combo.addItems(image_columns or columns)
+        layout.addWidget(self.photo_combo)
+        
+        layout.addWidget(QLabel("Шаблон имени файла (группа key - ключ):"))
+        self.pattern_edit = QLineEdit(PHOTO_KEY_PATTERN)
+        layout.addWidget(self.pattern_edit)
+        
+        self.dry_run_check = QCheckBox("Только проверить совпадения")
+        self.dry_run_check.setChecked(True)
+        layout.addWidget(self.dry_run_check)
+        
+        tips = QLabel("💡 Например (?P<key>\\d+)_.* для 123_front.jpg | "
+                      "сжатие - по параметрам последнего добавленного фото")
+        tips.setStyleSheet("color: gray; font-size: 10px;")
+        layout.addWidget(tips)
+        
+        btns = QHBoxLayout()
+        ok = QPushButton("✅ Далее")
+        ok.clicked.connect(self.accept)
+        cancel = QPushButton("❌ Отмена")
+        cancel.clicked.connect(self.reject)
+        btns.addWidget(ok)
+        btns.addWidget(cancel)
+        layout.addLayout(btns)
+        applyTextFit(self)
+        self.setMinimumSize(420, 420)
+    
+    def browse(self):
+        path = QFileDialog.getExistingDirectory(self, "Папка с фото")
+        if path:
+            self.folder_edit.setText(path)
+    
+    def getData(self):
+        return (self.folder_edit.text().strip(), self.key_combo.currentText(), self.photo_combo.currentText(),
+                self.pattern_edit.text().strip() or PHOTO_KEY_PATTERN, self.recursive_check.isChecked(),
+                self.dry_run_check.isChecked())
+
+
+class TranscodeDialog(QDialog):
+    def __init__(self, parent, columns, current, settings=PHOTO_INGEST):
+        super().__init__(parent)
+        self.setWindowTitle("Пережать фото")
+        self.setGeometry(300, 300, 420, 360)
+        self.setFont(QFont("Arial", 10))
+        self.columns = columns
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("♻️ Пережать все картинки колонки"))
+        
+        layout.addWidget(QLabel("Таблица:"))
+        self.table_combo = QComboBox()
+        self.table_combo.addItems(list(columns))
+        layout.addWidget(self.table_combo)
+        
+        layout.addWidget(QLabel("Колонка:"))
+        self.col_combo = QComboBox()
+        layout.addWidget(self.col_combo)
+        if current in columns:
+            self.table_combo.setCurrentText(current)
+        self.col_combo.addItems(columns.get(self.table_combo.currentText(), []))
+        self.table_combo.currentTextChanged.connect(self.fillColumns)
+        
+        form = QGridLayout()
+        form.addWidget(QLabel("Формат:"), 0, 0)
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(["JPEG", "WEBP"])
+        self.format_combo.setCurrentText(settings["format"])
+        form.addWidget(self.format_combo, 0, 1)
+        form.addWidget(QLabel("Качество:"), 1, 0)
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(10, 100)
+        self.quality_spin.setValue(settings["quality"])
+        form.addWidget(self.quality_spin, 1, 1)
+        form.addWidget(QLabel("Сторона до:"), 2, 0)
+        self.edge_spin = QSpinBox()
+        self.edge_spin.setRange(256, 8192)
+        self.edge_spin.setSingleStep(256)
+        self.edge_spin.setValue(settings["max_edge"])
+        form.addWidget(self.edge_spin, 2, 1)
+        layout.addLayout(form)
+        
+        self.vacuum_check = QCheckBox("VACUUM после завершения (вернуть место файлу)")
+        layout.addWidget(self.vacuum_check)
+        
+        tips = QLabel("💡 Картинки, которые не уменьшаются, остаются как есть")
+        tips.setStyleSheet("color: gray; font-size: 10px;")
+        layout.addWidget(tips)
+        
+        btns = QHBoxLayout()
+        ok = QPushButton("✅ Начать")
+        ok.clicked.connect(self.accept)
+        cancel = QPushButton("❌ Отмена")
+        cancel.clicked.connect(self.reject)
+        btns.addWidget(ok)
+        btns.addWidget(cancel)
+        layout.addLayout(btns)
+        applyTextFit(self)
+        self.setMinimumSize(380, 360)
+    
+    def fillColumns(self, table):
+        self.col_combo.clear()
+        self.col_combo.addItems(self.columns.get(table, []))
+    
+    def getData(self):
+        return self.table_combo.currentText(), self.col_combo.currentText(), self.vacuum_check.isChecked()
+    
+    def getSettings(self):
+        return {"max_edge": self.edge_spin.value(), "format": self.format_combo.currentText(),
+                "quality": self.quality_spin.value(), "thumbnail": False}
 
 
 class MultiTableSelectDialog(QDialog):
@@ -2753,11 +6312,9 @@ class JoinTablesDialog(QDialog):
     
     def loadTables(self):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            for t in cursor.fetchall():
-                if t[0] != self.table and t[0] != "sqlite_sequence":
-                    self.table2.addItem(t[0])
+            for t in self.parent().userTables(self.conn.cursor()):
+                if t != self.table:
+                    self.table2.addItem(t)
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка", str(e))
     